@@ -1,39 +1,76 @@
 from __future__ import annotations
-from .scratch import fetch_ids, cache_manager, fetch_data
+from .scratch import cache_manager, fetch_data
 from .ViewsMonth import ViewsMonth
 from diskcache import Cache
 from .config import inner_cache_path
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 
 inner_cache = Cache(inner_cache_path)
 
 class Country(object):
-    def __init__(self, id: int):
-        self.name = None
-        self.gwcode = None
-        self.isonum = None
-        self.isoab = None
-        self.capname = None
-        self.caplat = None
-        self.caplong = None
-        self.in_africa = None
-        self.in_me = None
-        self.month_start = None
-        self.month_end = None
-        self.year_start = None
-        self.year_end = None
-        self.lat = None
-        self.lon = None
-        self.id = self.__validate_id(id) if id != 0 else None
-        self.__populate_attributes() if id != 0 else None
-
-    @staticmethod
-    @inner_cache.memoize(typed=True, expire=600, tag="country_list")
-    def __validate_id(id):
-        id = int(id)
-        available_countries, _ = fetch_ids('country')
-        if id not in available_countries:
+
+    # Country attributes, and the descriptor columns they are populated from.
+    ATTRIBUTES = {'name': 'name', 'gwcode': 'gwcode', 'isonum': 'isonum', 'isoab': 'isoab',
+                  'capname': 'capname', 'caplat': 'caplat', 'caplong': 'caplong',
+                  'in_africa': 'in_africa', 'in_me': 'in_me',
+                  'month_start': 'month_start', 'month_end': 'month_end',
+                  'year_start': 'gwsyear', 'year_end': 'gweyear',
+                  'lat': 'centroidlat', 'lon': 'centroidlong'}
+
+    __slots__ = ('id',) + tuple(ATTRIBUTES)
+
+    def __new__(cls, id: int):
+        """
+        Countries are interned and immutable: Country(id) hands out the single instance for that id,
+        all of them built in one pass over the descriptors. Country(0) is terra nullius, with all attributes None.
+        """
+        by_id, _, _ = cls.__registry()
+        try:
+            return by_id[int(id)]
+        except KeyError:
             raise ValueError("No such country exists!")
-        return id
+
+    def __init__(self, id: int):
+        pass
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def __registry():
+        """
+        The interned countries, indexed by id, by ISO code and by GW code (the latter two giving the newest iteration).
+        Built once per process.
+        """
+        table = Country.__descriptor_table()
+        by_id = {0: Country.__make(None, {})}
+        for c_id, attributes in zip(table.index.tolist(), table.to_dict('records')):
+            by_id[c_id] = Country.__make(c_id, attributes)
+        # Newest first, like __extids2ids. Reversed, so that the newest iteration of a code is the one kept.
+        newest = table.sort_values(by='month_end', ascending=False, kind='mergesort')
+        by_iso = {iso: by_id[c_id] for iso, c_id in zip(newest.isoab[::-1], newest.index[::-1]) if pd.notna(iso)}
+        by_gw = {gw: by_id[c_id] for gw, c_id in zip(newest.gwcode[::-1], newest.index[::-1]) if pd.notna(gw)}
+        return by_id, by_iso, by_gw
+
+    @classmethod
+    def __make(cls, c_id, attributes):
+        country = object.__new__(cls)
+        object.__setattr__(country, 'id', c_id)
+        for attribute in cls.ATTRIBUTES:
+            object.__setattr__(country, attribute, attributes.get(attribute))
+        return country
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Country objects are immutable!")
+
+    def __delattr__(self, key):
+        raise AttributeError("Country objects are immutable!")
+
+    def __reduce__(self):
+        return Country, (self.id if self.id is not None else 0,)
+
+    def __hash__(self):
+        return hash(self.id)
 
     def __repr__(self):
         return f'Country({self.id})'
@@ -56,6 +93,55 @@ class Country(object):
         descriptors = fetch_data(loa_table='country', columns=columns)
         return descriptors
 
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def __descriptor_table():
+        """
+        The country descriptors, renamed and typed as the attributes of Country objects, indexed by id.
+        Built once per process.
+        """
+        descriptors = Country.__fetch_descriptors()
+        table = pd.DataFrame({attribute: descriptors[column].values
+                              for attribute, column in Country.ATTRIBUTES.items()},
+                             index=pd.Index(descriptors.id.astype('int64'), name='c_id'))
+        table['in_africa'] = table.in_africa.astype(bool)
+        table['in_me'] = table.in_me.astype(bool)
+        for column in ('month_start', 'month_end', 'year_start', 'year_end'):
+            table[column] = table[column].astype('int64')
+        return table
+
+    @classmethod
+    def exist(cls, ids):
+        """
+        Vectorized check of which ids Country(id) would accept, i.e. existing countries and 0 (terra nullius).
+        :param ids: An array-like of ViEWS country ids. Non-numeric values and nulls are never valid.
+        :return: A boolean numpy array
+        """
+        ids = pd.to_numeric(pd.Series(ids), errors='coerce')
+        return (ids.isin(cls.__descriptor_table().index) | (ids == 0)).values
+
+    @classmethod
+    def lookup(cls, ids, attributes):
+        """
+        Columnar equivalent of reading attributes off Country(id) for each id in an array, as one indexed take.
+        :param ids: An array-like of ViEWS country ids. The id 0 (terra nullius) produces missing values.
+        :param attributes: An attribute name (e.g. 'isoab') or a list of attribute names, see Country.ATTRIBUTES
+        :return: A DataFrame with one column per attribute and one row per id.
+        Will crash with ValueError if any id is not a country, like Country(id) does.
+        """
+        attributes = [attributes] if isinstance(attributes, str) else list(attributes)
+        unknown = set(attributes) - set(cls.ATTRIBUTES)
+        if unknown:
+            raise KeyError(f"Countries have no attributes {unknown}")
+        table = cls.__descriptor_table()
+        ids = np.asarray(ids, dtype='int64')
+        positions = table.index.get_indexer(ids)
+        if ((positions == -1) & (ids != 0)).any():
+            raise ValueError("No such country exists!")
+        return pd.DataFrame({attribute: pd.api.extensions.take(table[attribute].array, positions,
+                                                               allow_fill=True)
+                             for attribute in attributes})
+
     @staticmethod
     @inner_cache.memoize(typed=True, expire=600000, tag="country_priogrid")
     def __fetch_priogrid():
@@ -63,6 +149,89 @@ class Country(object):
         priogrids = fetch_data(loa_table='pgy2cy', columns=columns)
         return priogrids
 
+    @staticmethod
+    @lru_cache(maxsize=1)
+    @inner_cache.memoize(typed=True, expire=600000, tag="country_priogrid_dense")
+    def __fetch_priogrid_lookup():
+        """
+        A dense (year, pg_id) -> c_id array built from pgy2cy, with 0 for terra nullius.
+        :return: A tuple (first_year, lookup), such that lookup[year - first_year, pg_id] is the c_id.
+        """
+        priogrids = Country.__fetch_priogrid()
+        priogrids = priogrids.drop_duplicates(subset=['pg_id', 'year'], keep='first')
+        first_year = int(priogrids.year.min())
+        lookup = np.zeros((int(priogrids.year.max()) - first_year + 1, 259201),
+                          dtype=np.min_scalar_type(int(priogrids.c_id.max())))
+        lookup[priogrids.year.values - first_year, priogrids.pg_id.values] = priogrids.c_id.values
+        return first_year, lookup
+
+    @staticmethod
+    @lru_cache(maxsize=2)
+    @inner_cache.memoize(typed=True, expire=600000, tag="country_priogrid_csr")
+    def __fetch_priogrid_index(by_year):
+        """
+        A compressed-sparse-row index from countries to the sorted pg_ids they cover, built from pgy2cy.
+        :param by_year: If False, row c_id holds every pg_id the country ever covered.
+        If True, row (year - first_year) * n_c + c_id holds the pg_ids covered in that year.
+        :return: A tuple (first_year, n_c, indptr, pg_ids), the pg_ids of row k being pg_ids[indptr[k]:indptr[k+1]]
+        """
+        priogrids = Country.__fetch_priogrid()
+        n_c = int(priogrids.c_id.max()) + 1
+        first_year = int(priogrids.year.min())
+        keys = priogrids.c_id.values.astype('int64')
+        n_keys = n_c
+        if by_year:
+            keys = (priogrids.year.values - first_year) * n_c + keys
+            n_keys = (int(priogrids.year.max()) - first_year + 1) * n_c
+        # A single sort of the (row, pg_id) pairs both groups the pg_ids by row and drops duplicates.
+        pairs = np.unique(keys * 259201 + priogrids.pg_id.values)
+        keys, pg_ids = np.divmod(pairs, 259201)
+        indptr = np.zeros(n_keys + 1, dtype='int64')
+        np.cumsum(np.bincount(keys, minlength=n_keys), out=indptr[1:])
+        return first_year, n_c, indptr, pg_ids.astype('int32')
+
+    @classmethod
+    def explode_priogrids(cls, c_ids, years=None):
+        """
+        Bulk, id-only version of priogrids(), exploding an array of c_ids to the pg_ids they cover.
+        :param c_ids: An array-like of ViEWS country ids
+        :param years: None for every pg_id the country ever covered, or a year, or an array-like of years
+        aligned with c_ids, for the pg_ids covered in that year.
+        :return: A tuple (positions, pg_ids) of aligned numpy arrays: for each pg_id, the position in c_ids it
+        belongs to. Countries covering no pg_id (e.g. terra nullius) do not appear in positions.
+        """
+        first_year, n_c, indptr, pg_ids = cls.__fetch_priogrid_index(years is not None)
+        c_ids = np.asarray(c_ids, dtype='int64')
+        keys = c_ids
+        inside = (0 <= c_ids) & (c_ids < n_c)
+        if years is not None:
+            rows = np.broadcast_to(np.asarray(years, dtype='int64') - first_year, c_ids.shape)
+            keys = rows * n_c + c_ids
+            inside &= (0 <= rows) & (keys < indptr.shape[0] - 1)
+        return Country.__explode_rows(indptr, pg_ids, keys, inside)
+
+    @staticmethod
+    def __explode_rows(indptr, values, keys, inside):
+        """
+        Gathers the CSR rows keys from (indptr, values), skipping the keys that are not inside.
+        :return: A tuple (positions, values) of aligned numpy arrays, positions being the index in keys of each value.
+        """
+        keys = np.where(inside, keys, 0)
+        starts = indptr[keys]
+        counts = np.where(inside, indptr[keys + 1] - starts, 0)
+        positions = np.repeat(np.arange(keys.shape[0]), counts)
+        offsets = np.arange(positions.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+        return positions, values[np.repeat(starts, counts) + offsets]
+
+    def priogrid_ids(self, year=None):
+        """
+        The pg_ids covered by the country, optionally in a given year, as a sorted numpy array.
+        """
+        if self.id is None:
+            return np.array([], dtype='int32')
+        _, pg_ids = Country.explode_priogrids([self.id], year)
+        return pg_ids
+
     @staticmethod
     @inner_cache.memoize(typed=True, expire=6000000, tag="country_neighbors")
     def __fetch_neighbors():
@@ -70,33 +239,97 @@ class Country(object):
         neighbors = fetch_data(loa_table='country_country_month_expanded', columns=columns)
         return neighbors
 
-    #@inner_cache.memoize(typed=True, expire=600000, tag="country_pg_outer")
-    def priogrids(self):
-        from .Priogrid import Priogrid
-        priogrids = Country.__fetch_priogrid()
-        priogrids = priogrids[priogrids.c_id == self.id]#.pg_id.drop_duplicates()
-        priogrids = priogrids[['pg_id']].drop_duplicates()
-        priogrids = [Priogrid(i) for i in list(priogrids.pg_id)]
-        return priogrids
-
+    @staticmethod
+    @lru_cache(maxsize=2)
+    @inner_cache.memoize(typed=True, expire=6000000, tag="country_adjacency")
+    def __fetch_adjacency(by_month):
+        """
+        A compressed-sparse-row adjacency index from countries to their sorted neighbors,
+        built from country_country_month_expanded.
+        Borders change rarely, so runs of consecutive months with identical borders share one epoch.
+        :param by_month: If False, row a_id holds every country that was ever a neighbor of a_id.
+        If True, row epochs[month_id - first_month] * n_c + a_id holds the neighbors in that month.
+        :return: A tuple (first_month, epochs, n_c, indptr, b_ids), the neighbors of row k being
+        b_ids[indptr[k]:indptr[k+1]]
+        """
+        neighbors = Country.__fetch_neighbors()
+        a_ids = neighbors.a_id.values.astype('int64')
+        b_ids = neighbors.b_id.values.astype('int64')
+        n_c = int(max(a_ids.max(), b_ids.max())) + 1
+        first_month = 0
+        epochs = np.zeros(1, dtype='int64')
+        edges = a_ids * n_c + b_ids
+        if by_month:
+            first_month = int(neighbors.month_id.min())
+            n_months = int(neighbors.month_id.max()) - first_month + 1
+            edges += (neighbors.month_id.values.astype('int64') - first_month) * n_c * n_c
+        # As in __fetch_priogrid_index, a single sort both groups the edges by month and a_id and drops duplicates.
+        edges = np.sort(edges)
+        edges = edges[np.concatenate(([True], edges[1:] != edges[:-1]))]
+        if by_month:
+            months, edges = np.divmod(edges, n_c * n_c)
+            bounds = np.zeros(n_months + 1, dtype='int64')
+            np.cumsum(np.bincount(months, minlength=n_months), out=bounds[1:])
+            new_epoch = np.ones(n_months, dtype=bool)
+            for month in range(1, n_months):
+                new_epoch[month] = not np.array_equal(edges[bounds[month - 1]:bounds[month]],
+                                                      edges[bounds[month]:bounds[month + 1]])
+            epochs = np.cumsum(new_epoch) - 1
+            keep = new_epoch[months]
+            edges = epochs[months[keep]] * n_c * n_c + edges[keep]
+        keys, b_ids = np.divmod(edges, n_c)
+        n_keys = (int(epochs[-1]) + 1) * n_c
+        indptr = np.zeros(n_keys + 1, dtype='int64')
+        np.cumsum(np.bincount(keys, minlength=n_keys), out=indptr[1:])
+        return first_month, epochs, n_c, indptr, b_ids.astype('int32')
 
+    @classmethod
+    def explode_neighbors(cls, c_ids, month_ids=None):
+        """
+        Bulk, id-only version of neighbors(), exploding an array of c_ids to their first-order neighbors.
+        :param c_ids: An array-like of ViEWS country ids
+        :param month_ids: None for every country that was ever a neighbor, or a month_id, or an array-like of
+        month_ids aligned with c_ids, for the neighbors in that month.
+        :return: A tuple (positions, b_ids) of aligned numpy arrays: for each neighbor b_id, the position in c_ids
+        it belongs to. Countries without neighbors (e.g. islands) do not appear in positions.
+        """
+        first_month, epochs, n_c, indptr, b_ids = cls.__fetch_adjacency(month_ids is not None)
+        c_ids = np.asarray(c_ids, dtype='int64')
+        keys = c_ids
+        inside = (0 <= c_ids) & (c_ids < n_c)
+        if month_ids is not None:
+            months = np.broadcast_to(np.asarray(month_ids, dtype='int64') - first_month, c_ids.shape)
+            inside &= (0 <= months) & (months < epochs.shape[0])
+            keys = epochs[np.where(inside, months, 0)] * n_c + c_ids
+        return Country.__explode_rows(indptr, b_ids, keys, inside)
 
+    def neighbor_ids(self, month_id=None):
+        """
+        The c_ids of the first-order neighbors of the country, optionally in a given month, as a sorted numpy array.
+        """
+        if self.id is None:
+            return np.array([], dtype='int32')
+        _, b_ids = Country.explode_neighbors([self.id], month_id)
+        return b_ids
 
+    def priogrids(self, as_array=False):
+        """
+        The priogrids covered by the country, as a list of Priogrid objects or, with as_array, a PriogridArray.
+        """
+        if as_array:
+            from .IdArray import PriogridArray
+            return PriogridArray(self.priogrid_ids())
+        from .Priogrid import Priogrid
+        return [Priogrid(i) for i in self.priogrid_ids()]
 
-    @inner_cache.memoize(typed=True, expire=600000, tag="country_neighbors_outer")
     def neighbors(self, month_id = None):
         """
         Returns the first-order neighbors of a given country at a certain timepoint
-        If no month is issued
-        :param month_id:
-        :return:
+        If no month is issued, every country that was ever a neighbor is returned.
+        :param month_id: An optional ViEWS month_id
+        :return: A list of Country objects, sorted by id
         """
-        neighbors = Country.__fetch_neighbors()
-        neighbors = neighbors[neighbors.a_id == self.id]
-        if month_id is not None:
-            neighbors = neighbors[neighbors.month_id == month_id]
-        neighbors = neighbors.b_id.unique()
-        return [Country(i) for i in list(neighbors)]
+        return [Country(i) for i in self.neighbor_ids(month_id)]
 
     @staticmethod
     def __extid2id(name_value, name_var='isoab', month_id=None):
@@ -128,16 +361,96 @@ class Country(object):
             raise ValueError(f"Country with {name_var} = {name_value} does not exist at month {month_id}!")
 
 
+    @staticmethod
+    def __extids2ids(name_values, name_var='isoab', month_ids=None):
+        """
+        Bulk version of __extid2id, translating an array of alternate ids to ViEWS ids.
+        Each distinct (name_value, month_id) pair is resolved once, through a single interval join against the
+        [month_start, month_end] ranges of the descriptors.
+        :param name_values: An array-like of values in the name_var system, normalized like in __extid2id
+        :param name_var: The name of the system to use (e.g. isoab or gwcode)
+        :param month_ids: An optional array-like of ViEWS month ids, aligned with name_values.
+        Newest iteration of the country is returned if not given.
+        :return: A tuple (ids, valid) of numpy arrays. ids are 0 wherever valid is False.
+        """
+        descriptors = Country.__fetch_descriptors()[['id', name_var, 'month_start', 'month_end']]
+        descriptors = descriptors.rename(columns={name_var: 'name_value'})
+        if name_var == 'gwcode':
+            descriptors['name_value'] = pd.to_numeric(descriptors.name_value, errors='coerce')
+
+        if month_ids is None:
+            # Newest iteration of each country, i.e. the latest month_end for each name_value.
+            newest = descriptors.sort_values(by='month_end', ascending=False, kind='mergesort')
+            newest = newest.drop_duplicates(subset='name_value').set_index('name_value').id
+            codes, uniques = pd.factorize(pd.Series(name_values))
+            resolved = newest.reindex(uniques).fillna(0).values.astype('int64')
+            ids = np.where(codes == -1, 0, resolved[codes])
+            return ids, ids != 0
+
+        value_codes, values = pd.factorize(pd.Series(name_values))
+        month_codes, months = pd.factorize(pd.to_numeric(pd.Series(month_ids), errors='coerce'))
+        pair_codes = np.where((value_codes == -1) | (month_codes == -1), -1,
+                              value_codes.astype('int64') * len(months) + month_codes)
+        codes, pairs = pd.factorize(pair_codes)
+        uniques = pd.DataFrame({'name_value': values.take(pairs // max(len(months), 1), allow_fill=False),
+                                'month_id': months.take(pairs % max(len(months), 1), allow_fill=False),
+                                'pair': np.arange(pairs.shape[0])})
+        # Pairs with a missing code or month never resolve.
+        uniques = uniques[pairs != -1]
+        matches = uniques.merge(descriptors, on='name_value', how='inner')
+        matches = matches[(matches.month_start <= matches.month_id) & (matches.month_end >= matches.month_id)]
+        resolved = matches.groupby('pair').id.max().reindex(np.arange(pairs.shape[0])).fillna(0)
+        ids = resolved.values.astype('int64')[codes]
+        return ids, ids != 0
+
+    @staticmethod
+    def isos2ids(isos, month_ids=None):
+        """
+        Bulk version of iso2id.
+        :param isos: An array-like of ISO 3-letter codes
+        :param month_ids: An optional array-like of month ids, aligned with isos
+        :return: A tuple (ids, valid) of numpy arrays. ids are 0 wherever valid is False.
+        """
+        # Normalize each distinct code once, rather than every row.
+        codes, uniques = pd.factorize(pd.Series(isos, dtype='object'))
+        uniques = pd.Series(uniques, dtype='object').astype(str).str.strip().str.upper().to_numpy(dtype='object')
+        # Missing isos (code -1) pick up the trailing None.
+        isos = np.append(uniques, None)[codes]
+        return Country.__extids2ids(isos, name_var='isoab', month_ids=month_ids)
+
+    @staticmethod
+    def gwcodes2ids(gwcodes, month_ids=None):
+        """
+        Bulk version of gwcode2id.
+        :param gwcodes: An array-like of Gleditsch-Ward codes
+        :param month_ids: An optional array-like of month ids, aligned with gwcodes
+        :return: A tuple (ids, valid) of numpy arrays. ids are 0 wherever valid is False.
+        """
+        gwcodes = pd.to_numeric(pd.Series(gwcodes), errors='coerce').astype('float64')
+        return Country.__extids2ids(gwcodes, name_var='gwcode', month_ids=month_ids)
+
     @staticmethod
     def iso2id(iso, month_id = None):
         iso = str(iso).strip().upper()
+        if month_id is None:
+            return Country.__newest(iso, name_var='isoab')
         return Country.__extid2id(iso, name_var='isoab', month_id=month_id)
 
     @staticmethod
     def gwcode2id(gwcode, month_id = None):
         gwcode = int(gwcode)
+        if month_id is None:
+            return Country.__newest(gwcode, name_var='gwcode')
         return Country.__extid2id(gwcode, name_var='gwcode', month_id=month_id)
 
+    @staticmethod
+    def __newest(name_value, name_var):
+        _, by_iso, by_gw = Country.__registry()
+        try:
+            return (by_iso if name_var == 'isoab' else by_gw)[name_value].id
+        except KeyError:
+            raise ValueError(f"Country with {name_var} = {name_value} does not exist!")
+
     @classmethod
     def from_iso(cls, iso, month_id = None):
         return cls(cls.iso2id(iso, month_id))
@@ -148,35 +461,26 @@ class Country(object):
 
     @classmethod
     def from_priogrid(cls, pg_id, year=None):
-        priogrids = cls.__fetch_priogrid()
-        if year is None:
-            year = ViewsMonth.now().year
-        try:
-            # Find the country for the given pg_id/year combo
-            c = cls(priogrids[(priogrids.pg_id == int(pg_id)) & (priogrids.year == int(year))].c_id.values[0])
-        except IndexError:
-            # Country not found, give the country 0 which is terra nulius, international land.
-            c = cls(0)
-        return c
-
-    def __populate_attributes(self):
-        descriptors = self.__fetch_descriptors()
-        descriptors = descriptors[descriptors.id == self.id].iloc[0]
-        self.name = descriptors['name']
-        self.gwcode = descriptors.gwcode
-        self.isonum = descriptors.isonum
-        self.isoab = descriptors.isoab
-        self.capname = descriptors.capname
-        self.caplat = descriptors.caplat
-        self.caplong = descriptors.caplong
-        self.in_africa = bool(descriptors.in_africa)
-        self.in_me = bool(descriptors.in_me)
-        self.month_start = int(descriptors.month_start)
-        self.month_end = int(descriptors.month_end)
-        self.year_start = int(descriptors.gwsyear)
-        self.year_end = int(descriptors.gweyear)
-        self.lat = descriptors.centroidlat
-        self.lon = descriptors.centroidlong
+        # A pg_id/year combo without a country gives the country 0, which is terra nulius, international land.
+        return cls(int(cls.priogrids2ids([int(pg_id)], year)[0]))
+
+    @classmethod
+    def priogrids2ids(cls, pg_ids, years=None):
+        """
+        Bulk version of from_priogrid, as a single fancy-index into a dense (year, pg_id) lookup.
+        :param pg_ids: An array-like of priogrid ids
+        :param years: A year, or an array-like of years aligned with pg_ids. Defaults to the current year.
+        :return: A numpy array of ViEWS country ids, with 0 for terra nulius (no country at that pg_id/year).
+        """
+        first_year, lookup = cls.__fetch_priogrid_lookup()
+        if years is None:
+            years = ViewsMonth.now().year
+        pg_ids = np.asarray(pg_ids, dtype='int64')
+        rows = np.broadcast_to(np.asarray(years, dtype='int64') - first_year, pg_ids.shape)
+        inside = (0 <= rows) & (rows < lookup.shape[0]) & (0 <= pg_ids) & (pg_ids < lookup.shape[1])
+        c_ids = lookup[np.where(inside, rows, 0), np.where(inside, pg_ids, 0)].astype('int64')
+        c_ids[~inside] = 0
+        return c_ids
 
     def __eq__(self, other):
         if isinstance(other, Country):
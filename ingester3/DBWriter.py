@@ -444,7 +444,7 @@ class DBWriter(object):
 
     def new_transfer(self, tname, drop_table=False):
 
-        cache_manager(clear=False)
+        cache_manager(clear=False, force=True)
 
         if self.recipe is None:
             self.publish()
@@ -542,7 +542,7 @@ class DBWriter(object):
         return recast
 
     def old_transfer(self):
-        cache_manager(clear=False)
+        cache_manager(clear=False, force=True)
 
         if self.recipe is None:
             self.publish()
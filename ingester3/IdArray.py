@@ -0,0 +1,372 @@
+from __future__ import annotations
+import numbers
+import operator
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import ExtensionArray, ExtensionDtype, register_extension_dtype
+from .Priogrid import Priogrid
+from .ViewsMonth import ViewsMonth
+
+
+class IdDtype(ExtensionDtype):
+    """
+    Base pandas dtype for columns of ViEWS ids. Subclasses set the name and the array type.
+    """
+    type = int
+    na_value = pd.NA
+    _array_type = None
+
+    @classmethod
+    def construct_array_type(cls):
+        return cls._array_type
+
+
+class IdArray(ExtensionArray):
+    """
+    Base pandas ExtensionArray for ViEWS ids, held in an int32 numpy array with -1 for missing values,
+    i.e. 4 bytes per element. Subclasses set the dtype, the valid id range and the scalar (object) type.
+    """
+    _dtype = None
+    _min_id = 0
+    _max_id = np.iinfo('int32').max
+    _scalar_type = None
+
+    def __init__(self, values, copy=False):
+        """
+        :param values: An array-like of integer ids, -1 for missing values
+        :param copy: Copy the values, rather than wrapping them
+        """
+        values = np.asarray(values)
+        if values.ndim != 1:
+            raise ValueError(f"{type(self).__name__} must be 1-dimensional")
+        if values.dtype != 'int32':
+            # Validated before narrowing, as ids past the int32 range would wrap around silently.
+            values = values.astype('int64')
+            self._validate(values)
+            values = values.astype('int32')
+        else:
+            self._validate(values)
+            values = values.copy() if copy else values
+        self._data = values
+
+    @classmethod
+    def _validate(cls, ids):
+        ids = ids[ids != -1]
+        if ids.size > 0 and (ids.min() < cls._min_id or ids.max() > cls._max_id):
+            raise ValueError(f"ID must be between {cls._min_id} and {cls._max_id}")
+
+    @classmethod
+    def valid(cls, values):
+        """
+        Vectorized soft validation, i.e. which values could be turned into ids of this type without crashing.
+        :param values: An array-like of anything
+        :return: A boolean numpy array. Missing values are not valid.
+        """
+        ids = pd.to_numeric(pd.Series(values, dtype='object'), errors='coerce').to_numpy(dtype='float64')
+        return (ids == np.floor(ids)) & (ids >= cls._min_id) & (ids <= cls._max_id)
+
+    @classmethod
+    def _scalar_to_id(cls, value):
+        if cls._scalar_type is not None and isinstance(value, cls._scalar_type):
+            return -1 if value.id is None else value.id
+        if value is None or value is pd.NA or (isinstance(value, numbers.Real) and np.isnan(value)):
+            return -1
+        if isinstance(value, bool) or not isinstance(value, numbers.Real) or int(value) != value:
+            raise TypeError(f"Cannot interpret {value!r} as a {cls._dtype.name} id")
+        return int(value)
+
+    @classmethod
+    def _to_ids(cls, values):
+        """
+        Turns an array-like of ids, id objects (e.g. Priogrid) and missing values into an int64 array, -1 for missing.
+        """
+        if isinstance(values, cls):
+            return values._data.astype('int64')
+        if isinstance(values, (pd.Series, pd.Index)):
+            values = values.array
+        values = np.asarray(values) if not isinstance(values, ExtensionArray) else values.to_numpy(dtype='object')
+        if values.dtype.kind in 'iu':
+            return values.astype('int64')
+        if values.dtype.kind == 'f':
+            missing = np.isnan(values)
+            if (values[~missing] != np.floor(values[~missing])).any():
+                raise TypeError(f"Cannot interpret fractional values as {cls._dtype.name} ids")
+            return np.where(missing, -1, values).astype('int64')
+        return np.array([cls._scalar_to_id(value) for value in values.ravel()], dtype='int64')
+
+    @classmethod
+    def _from_sequence(cls, scalars, *, dtype=None, copy=False):
+        if isinstance(getattr(scalars, 'dtype', None), pd.StringDtype):
+            return cls._from_sequence_of_strings(scalars, dtype=dtype, copy=copy)
+        ids = cls._to_ids(scalars)
+        cls._validate(ids)
+        return cls(ids)
+
+    @classmethod
+    def _from_sequence_of_strings(cls, strings, *, dtype=None, copy=False):
+        """
+        Parses ids from strings, e.g. for astype on a str column or read_csv(dtype={'pg_id': 'priogrid'}).
+        Strings are read as valid reads them, so a string converts if and only if valid is True for it.
+        Missing values become NA.
+        """
+        strings = pd.Series(strings, dtype='object')
+        valid = cls.valid(strings)
+        invalid = ~valid & strings.notna().to_numpy()
+        if invalid.any():
+            raise ValueError(f"Cannot interpret {strings[invalid].iloc[0]!r} as a {cls._dtype.name} id")
+        ids = pd.to_numeric(strings, errors='coerce').to_numpy(dtype='float64')
+        return cls(np.where(valid, ids, -1).astype('int64'))
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls(values)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        return cls(np.concatenate([array._data for array in to_concat]))
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def __len__(self):
+        return self._data.shape[0]
+
+    def __getitem__(self, item):
+        if pd.api.types.is_integer(item):
+            value = self._data[item]
+            return pd.NA if value == -1 else int(value)
+        item = pd.api.indexers.check_array_indexer(self, item)
+        return type(self)(self._data[item])
+
+    def __setitem__(self, key, value):
+        if not pd.api.types.is_scalar(key):
+            key = pd.api.indexers.check_array_indexer(self, key)
+        if pd.api.types.is_list_like(value) and not isinstance(value, self._scalar_type or ()):
+            ids = self._to_ids(value)
+        else:
+            ids = np.int64(self._scalar_to_id(value))
+        self._validate(np.atleast_1d(ids))
+        self._data[key] = ids
+
+    def __array__(self, dtype=None, copy=None):
+        missing = self.isna()
+        if not missing.any():
+            return self._data.astype(dtype if dtype is not None else 'int64')
+        if dtype is not None and np.dtype(dtype).kind == 'f':
+            return np.where(missing, np.nan, self._data).astype(dtype)
+        if dtype is not None and np.dtype(dtype).kind != 'O':
+            raise ValueError("Cannot convert missing ids to a non-nullable dtype")
+        values = self._data.astype('object')
+        values[missing] = pd.NA
+        return values
+
+    def _compare(self, other, op):
+        """
+        Element-wise comparison on the ids. Comparisons involving a missing value are False.
+        """
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+        if pd.api.types.is_scalar(other) or isinstance(other, self._scalar_type or ()):
+            other = np.int64(self._scalar_to_id(other))
+        else:
+            other = self._to_ids(other)
+        return op(self._data, other) & ~self.isna() & (other != -1)
+
+    def __eq__(self, other):
+        return self._compare(other, operator.eq)
+
+    def __lt__(self, other):
+        return self._compare(other, operator.lt)
+
+    def __le__(self, other):
+        return self._compare(other, operator.le)
+
+    def __gt__(self, other):
+        return self._compare(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._compare(other, operator.ge)
+
+    def isna(self):
+        return self._data == -1
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        if allow_fill:
+            fill_value = -1 if fill_value is None else self._scalar_to_id(fill_value)
+        return type(self)(pd.api.extensions.take(self._data, indices, allow_fill=allow_fill, fill_value=fill_value))
+
+    def copy(self):
+        return type(self)(self._data.copy())
+
+    def _values_for_factorize(self):
+        return self._data, -1
+
+    def _values_for_argsort(self):
+        return self._data
+
+    def _reduce(self, name, *, skipna=True, keepdims=False, **kwargs):
+        if name not in ('min', 'max'):
+            return super()._reduce(name, skipna=skipna, keepdims=keepdims, **kwargs)
+        missing = self.isna()
+        values = self._data[~missing]
+        if values.size == 0 or (missing.any() and not skipna):
+            result = pd.NA
+        else:
+            result = int(getattr(values, name)())
+        return type(self)([-1 if result is pd.NA else result]) if keepdims else result
+
+
+@register_extension_dtype
+class PriogridDtype(IdDtype):
+    """
+    pandas dtype for pg_id columns, e.g. df.pg_id.astype('priogrid')
+    """
+    name = 'priogrid'
+
+
+class PriogridArray(IdArray):
+    """
+    An array of priogrid ids, with the Priogrid geometry as vectorized properties.
+    The columnar alternative to lists of Priogrid objects, at 4 bytes per cell.
+    """
+    _dtype = PriogridDtype()
+    _min_id = 1
+    _max_id = 259200
+    _scalar_type = Priogrid
+
+    # (row, col) offsets of the rook and queen contiguity neighbors, as in Priogrid.rook/queen_contiguity
+    ROOK = {'up': (1, 0), 'left': (0, -1), 'right': (0, 1), 'down': (-1, 0)}
+    QUEEN = {'up_left': (1, -1), 'up': (1, 0), 'up_right': (1, 1), 'left': (0, -1), 'right': (0, 1),
+             'down_left': (-1, -1), 'down': (-1, 0), 'down_right': (-1, 1)}
+
+    @property
+    def row(self):
+        return pd.array(np.where(self.isna(), pd.NA, Priogrid.id2row_array(self._data)), dtype='Int64')
+
+    @property
+    def col(self):
+        return pd.array(np.where(self.isna(), pd.NA, Priogrid.id2col_array(self._data)), dtype='Int64')
+
+    @property
+    def lat(self):
+        return np.where(self.isna(), np.nan, Priogrid.id2lat_array(self._data))
+
+    @property
+    def lon(self):
+        return np.where(self.isna(), np.nan, Priogrid.id2lon_array(self._data))
+
+    def neighbors(self, contiguity='rook'):
+        """
+        Vectorized equivalent of the Priogrid contiguity matrices, for every cell at once.
+        :param contiguity: 'rook' (4 neighbors) or 'queen' (8 neighbors)
+        :return: A DataFrame with one PriogridArray column per direction (see ROOK and QUEEN),
+        NA where the neighbor falls off the grid (where the Priogrid matrices have None) or the cell itself is NA.
+        """
+        if contiguity not in ('rook', 'queen'):
+            raise ValueError("contiguity must be one of 'rook' or 'queen'")
+        offsets = self.ROOK if contiguity == 'rook' else self.QUEEN
+        rows, cols = np.divmod(self._data.astype('int64'), 720)
+        rows += 1
+        edges = {(1, 0): rows < 360, (-1, 0): rows > 1, (0, 1): cols < 720, (0, -1): cols > 1}
+        neighbors = {}
+        for direction, (d_row, d_col) in offsets.items():
+            inside = ~self.isna() & edges.get((d_row, 0), True) & edges.get((0, d_col), True)
+            ids = Priogrid.rowcol2id(rows + d_row, cols + d_col)
+            # Cells on col 0 (ids divisible by 720) can point past either end of the id range.
+            inside &= (ids >= self._min_id) & (ids <= self._max_id)
+            neighbors[direction] = PriogridArray(np.where(inside, ids, -1))
+        return pd.DataFrame(neighbors)
+
+
+@register_extension_dtype
+class ViewsMonthDtype(IdDtype):
+    """
+    pandas dtype for month_id columns, e.g. df.month_id.astype('views_month')
+    """
+    name = 'views_month'
+
+
+class ViewsMonthArray(IdArray):
+    """
+    An array of ViEWS month ids, with the ViewsMonth calendar as vectorized properties.
+    The columnar alternative to lists of ViewsMonth objects.
+    """
+    _dtype = ViewsMonthDtype()
+    _min_id = 1
+    _scalar_type = ViewsMonth
+
+    @classmethod
+    def from_date(cls, dates):
+        """
+        Vectorized ViewsMonth.from_date, e.g. from a datetime64 column or a DatetimeIndex. NaT becomes NA.
+        :param dates: An array-like of (timezone-naive) datetime64 values
+        :return: A ViewsMonthArray
+        """
+        dates = np.asarray(dates)
+        if dates.dtype.kind != 'M':
+            dates = dates.astype('datetime64[ns]')
+        ids, valid = ViewsMonth.datetime2id_array(dates)
+        if (~valid & ~np.isnat(dates)).any():
+            raise ValueError("Year must be >=1980")
+        return cls(np.where(valid, ids, -1))
+
+    @classmethod
+    def from_year_month(cls, year, month):
+        """
+        Vectorized ViewsMonth.from_year_month. NaN years or months become NA.
+        :param year: An array-like of years
+        :param month: An array-like of months
+        :return: A ViewsMonthArray
+        """
+        year = np.asarray(year, dtype='float64')
+        month = np.asarray(month, dtype='float64')
+        ids, valid = ViewsMonth.year_month2id_array(year, month)
+        if (~valid & ~np.isnan(year) & ~np.isnan(month)).any():
+            raise ValueError("Year must be >=1980 and month must be between 1 and 12")
+        return cls(np.where(valid, ids, -1))
+
+    @property
+    def year(self):
+        return pd.array(np.where(self.isna(), pd.NA, ViewsMonth.id2year_array(self._data)), dtype='Int64')
+
+    @property
+    def month(self):
+        return pd.array(np.where(self.isna(), pd.NA, ViewsMonth.id2month_array(self._data)), dtype='Int64')
+
+    @property
+    def start_date(self):
+        """
+        The start dates of the months, as a datetime64[D] numpy array (NaT for missing values).
+        np.datetime_as_string gives the ISO strings of the scalar ViewsMonth.start_date.
+        """
+        return self.to_datetime64().astype('datetime64[D]')
+
+    @property
+    def end_date(self):
+        """
+        The end dates of the months, as a datetime64[D] numpy array (NaT for missing values).
+        """
+        return (self.to_datetime64() + 1).astype('datetime64[D]') - 1
+
+    def to_datetime64(self):
+        """
+        :return: The months as a datetime64[M] numpy array, NaT for missing values
+        """
+        months = ViewsMonth.id2datetime64_array(self._data)
+        months[self.isna()] = np.datetime64('NaT')
+        return months
+
+    def astype(self, dtype, copy=True):
+        dtype = pd.api.types.pandas_dtype(dtype)
+        if isinstance(dtype, np.dtype) and dtype.kind == 'M':
+            return self.to_datetime64().astype(dtype)
+        return super().astype(dtype, copy=copy)
+
+
+PriogridDtype._array_type = PriogridArray
+ViewsMonthDtype._array_type = ViewsMonthArray
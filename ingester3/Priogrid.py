@@ -1,5 +1,6 @@
 from __future__ import annotations
 from typing import List
+import numpy as np
 
 class Priogrid(object):
 
@@ -80,23 +81,29 @@ class Priogrid(object):
         else:
             return None
 
-    def rook_contiguity(self) -> List[List[Priogrid]]:
+    def rook_contiguity(self, as_array=False) -> List[List[Priogrid]]:
         """
         Factory object, producing the rook contiguity matrix (3x3 cross convolution kernel) of the current object
         Objects outside of edges return None.
+        :param as_array: Return the matrix flattened row by row into a PriogridArray, with NA instead of None
         :return: A matrix (2-D List of lists) of Priogrid objects representing the rook contiguity matrix
         """
+        if as_array:
+            return self.__contiguity_array('rook')
         up = [None, self.next_up(), None]
         center = [self.next_left(), self, self.next_right()]
         down = [None, self.next_down(), None]
         return [up, center, down]
 
-    def queen_contiguity(self) -> List[List[Priogrid]]:
+    def queen_contiguity(self, as_array=False) -> List[List[Priogrid]]:
         """
         Factory object, producing the queen contiguity matrix (3x  convolution kernel) of the current object
         Objects outside of edges return None.
+        :param as_array: Return the matrix flattened row by row into a PriogridArray, with NA instead of None
         :return: A matrix (2-D List of lists) of Priogrid objects representing the queen contiguity matrix
         """
+        if as_array:
+            return self.__contiguity_array('queen')
 
         queen = self.rook_contiguity()
         if queen[0][1] is not None:
@@ -107,6 +114,13 @@ class Priogrid(object):
             queen[2][2] = queen[2][1].next_right()
         return queen
 
+    def __contiguity_array(self, contiguity):
+        from .IdArray import PriogridArray
+        neighbors = PriogridArray([self.id]).neighbors(contiguity).iloc[0]
+        kernel = [['up_left', 'up', 'up_right'], ['left', None, 'right'], ['down_left', 'down', 'down_right']]
+        return PriogridArray._from_sequence([self.id if direction is None else neighbors.get(direction)
+                                             for line in kernel for direction in line])
+
     @classmethod
     def id2lat(cls, id):
         """
@@ -152,6 +166,86 @@ class Priogrid(object):
     def rowcol2id(row, col):
         return (row - 1) * 720 + col
 
+    @staticmethod
+    def id2row_array(ids):
+        """
+        Vectorized id2row over an array-like of ids.
+        :param ids: An array-like of priogrid ids
+        :return: A numpy array of rows, identical to calling id2row on each element
+        """
+        return np.floor_divide(np.asarray(ids, dtype='int64'), 720) + 1
+
+    @staticmethod
+    def id2col_array(ids):
+        """
+        Vectorized id2col over an array-like of ids.
+        :param ids: An array-like of priogrid ids
+        :return: A numpy array of cols, identical to calling id2col on each element
+        """
+        return np.remainder(np.asarray(ids, dtype='int64'), 720)
+
+    @staticmethod
+    def row2lat_array(rows):
+        return (-90 + (np.asarray(rows) * 0.5)) - 0.25
+
+    @staticmethod
+    def col2lon_array(cols):
+        return (-180 + (np.asarray(cols) * 0.5)) - 0.25
+
+    @classmethod
+    def id2lat_array(cls, ids):
+        return cls.row2lat_array(cls.id2row_array(ids))
+
+    @classmethod
+    def id2lon_array(cls, ids):
+        return cls.col2lon_array(cls.id2col_array(ids))
+
+    @classmethod
+    def id2geometry_array(cls, ids):
+        """
+        Computes row, col, lat and lon for an array of ids in a single pass.
+        :param ids: An array-like of priogrid ids
+        :return: A tuple of numpy arrays (row, col, lat, lon)
+        """
+        ids = np.asarray(ids, dtype='int64')
+        row, col = np.divmod(ids, 720)
+        row += 1
+        return row, col, cls.row2lat_array(row), cls.col2lon_array(col)
+
+    @classmethod
+    def bbox_array(cls, min_row, max_row, min_col, max_col):
+        """
+        All the priogrid ids in the rectangle spanned by the given rows and cols (inclusive),
+        identical to calling from_row_col on every row/col pair in the box.
+        :param min_row: The first row of the box
+        :param max_row: The last row of the box
+        :param min_col: The first col of the box
+        :param max_col: The last col of the box
+        :return: A sorted numpy array of priogrid ids
+        """
+        rows, cols = np.meshgrid(np.arange(min_row, max_row + 1, dtype='int64'),
+                                 np.arange(min_col, max_col + 1, dtype='int64'), indexing='ij')
+        ids = cls.rowcol2id(rows, cols).ravel()
+        if ids.size > 0 and (ids[0] < 0 or ids[-1] > 259200):
+            raise ValueError("ID must be between 1 and 259200")
+        return ids
+
+    @classmethod
+    def latlon2id_array(cls, lat, lon):
+        """
+        Vectorized latlon2id. Invalid coordinates (out of range or NaN) do not raise, but are flagged in a mask.
+        :param lat: An array-like of latitudes
+        :param lon: An array-like of longitudes
+        :return: A tuple (ids, valid) of numpy arrays. ids are 0 wherever valid is False.
+        """
+        lat = np.asarray(lat, dtype='float64')
+        lon = np.asarray(lon, dtype='float64')
+        valid = (-90 <= lat) & (lat <= 90) & (-180 <= lon) & (lon <= 180)
+        row = (np.abs(-90 - np.where(valid, lat, -90)) / 0.5).astype('int64') + 1
+        col = (np.abs(-180 - np.where(valid, lon, -180)) / 0.5).astype('int64') + 1
+        ids = np.where(valid, cls.rowcol2id(row, col), 0)
+        return ids, valid
+
     @staticmethod
     def __validate_id(id):
         if not (0 <= id <= 259200):
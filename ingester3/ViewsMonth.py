@@ -1,4 +1,5 @@
 from datetime import datetime, date, timedelta
+import numpy as np
 
 class ViewsMonth(object):
 
@@ -40,6 +41,58 @@ class ViewsMonth(object):
     def id2year(cls, id):
         return int((id - 1) / 12) + 1980
 
+    @staticmethod
+    def id2month_array(ids):
+        """
+        Vectorized id2month over an array-like of month ids.
+        """
+        return np.remainder(np.asarray(ids, dtype='int64') - 1, 12) + 1
+
+    @staticmethod
+    def id2year_array(ids):
+        """
+        Vectorized id2year over an array-like of month ids.
+        """
+        return np.floor_divide(np.asarray(ids, dtype='int64') - 1, 12) + 1980
+
+    @staticmethod
+    def year_month2id_array(year, month):
+        """
+        Vectorized from_year_month. Invalid (pre-1980, month outside 1..12 or NaN) inputs do not raise,
+        but are flagged in a mask.
+        :param year: An array-like of years
+        :param month: An array-like of months
+        :return: A tuple (ids, valid) of numpy arrays. ids are 0 wherever valid is False.
+        """
+        year = np.asarray(year, dtype='float64')
+        month = np.asarray(month, dtype='float64')
+        valid = (year >= 1980) & (1 <= month) & (month <= 12)
+        ids = np.trunc(np.where(valid, (year - 1980) * 12 + month, 0)).astype('int64')
+        return ids, valid
+
+    @staticmethod
+    def datetime2id_array(dates):
+        """
+        Vectorized from_date over an array-like of (timezone-naive) datetime64 values.
+        NaT or pre-1980 dates do not raise, but are flagged in a mask.
+        :param dates: An array-like of datetime64 values
+        :return: A tuple (ids, valid) of numpy arrays. ids are 0 wherever valid is False.
+        """
+        months = np.asarray(dates).astype('datetime64[M]')
+        valid = ~np.isnat(months) & (months >= np.datetime64('1980-01', 'M'))
+        # datetime64[M] counts months from 1970-01, i.e. 1980-01 is 120, and has month_id 1.
+        ids = np.where(valid, months.astype('int64') - 119, 0)
+        return ids, valid
+
+    @staticmethod
+    def id2datetime64_array(ids):
+        """
+        Vectorized inverse of datetime2id_array.
+        :param ids: An array-like of month ids
+        :return: A datetime64[M] numpy array of the months
+        """
+        return (np.asarray(ids, dtype='int64') + 119).astype('datetime64[M]')
+
     @staticmethod
     def __validate(id):
         if int(id) <= 0:
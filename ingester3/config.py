@@ -55,8 +55,13 @@ source_cache_path = os.path.join(os.path.expanduser(working_dir), 'db_cache')
 secondary_cache_path = os.path.join(os.path.expanduser(working_dir), 'second_cache')
 
 inner_cache_path = os.path.join(os.path.expanduser(working_dir), 'inner_cache')
+id_matrix_path = os.path.join(os.path.expanduser(working_dir), 'id_matrix')
+ids_store_path = os.path.join(os.path.expanduser(working_dir), 'ids_store')
 #os.makedirs(secondary_cache_path, exist_ok=True)
 
+# Seconds between two cache staleness checks against the DB timestamps, see scratch.cache_manager
+cache_check_ttl = float(os.getenv('INGESTER_CACHE_TTL', 60))
+
 log_file = os.path.join(os.path.expanduser(working_dir), 'log.log')
 
 log_level = 'DEBUG' if os.getenv('INGESTER_LOGGING') is None else os.getenv('INGESTER_LOGGING')
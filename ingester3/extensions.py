@@ -1,14 +1,73 @@
 from .Priogrid import Priogrid
 from .ViewsMonth import ViewsMonth
 from .Country import Country
-from .scratch import fetch_ids, fetch_ids_df, cache_manager
+from .scratch import fetch_ids, fetch_ids_df, cache_manager, lookup_ids, memory_tier, register_memory_tier
 from .FuzzyCountry import FuzzyCountry
 import pandas as pd
 import warnings
-from functools import partial
+import numpy as np
+import hashlib
+import threading
+from collections import OrderedDict
 
 pd.options.mode.chained_assignment = None
 
+
+class _ResultCache:
+    """
+    A bounded LRU cache for results derived from a key column (e.g. c_id validation and country attributes).
+    Entries are keyed by a fingerprint of the column's buffer, so repeated accessor calls on an unchanged frame
+    (or on another frame holding the same ids) can skip revalidation and reuse the computed columns.
+    Emptied together with the memory tier, i.e. by cache_manager(clear=True) and whenever the DB schema changes.
+    """
+    def __init__(self, max_entries=256, max_bytes=256 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(column):
+        """
+        :param column: A pandas Series
+        :return: A hashable fingerprint of the column's dtype, length and contents,
+        or None for object columns, whose buffers only hold pointers.
+        """
+        values = column.to_numpy()
+        if values.dtype.hasobject:
+            return None
+        digest = hashlib.sha1(np.ascontiguousarray(values).view(np.uint8), usedforsecurity=False).digest()
+        return values.dtype.str, values.shape[0], digest
+
+    def get(self, key):
+        with self.__lock:
+            if key not in self.__entries:
+                return None
+            self.__entries.move_to_end(key)
+            return self.__entries[key][0]
+
+    def put(self, key, value):
+        size = getattr(value, 'nbytes', 0)
+        if size > self.max_bytes:
+            return
+        with self.__lock:
+            if key in self.__entries:
+                self.__bytes -= self.__entries.pop(key)[1]
+            self.__entries[key] = (value, size)
+            self.__bytes += size
+            while len(self.__entries) > self.max_entries or self.__bytes > self.max_bytes:
+                self.__bytes -= self.__entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+
+_results = _ResultCache()
+register_memory_tier(_results.clear)
+
 @pd.api.extensions.register_dataframe_accessor("c")
 class CAccessor:
     """
@@ -34,45 +93,13 @@ class CAccessor:
         """
         if "c_id" not in obj.columns:
             raise AttributeError("Must have a c_id column!")
-        #mid = obj['c_id'].astype('int')
-        obj.apply(lambda row: Country(row['c_id']).id, axis=1)
-
-    @staticmethod
-    def __soft_validate(row):
-        """
-        Soft-validate a df containing c_id values. Will produce a valid_latlon column to the existing dataframe
-        """
-        try:
-            _ = Country(row.c_id).id
-            ok = True
-        except ValueError:
-            ok = False
-        return ok
-
-    @staticmethod
-    def __soft_validate_iso(row, iso_col='iso', month_col=None):
-        try:
-            if month_col is not None:
-                _ = Country.from_iso(row[iso_col].strip().upper(), int(row[month_col]))
-            else:
-                _ = Country.from_iso(row[iso_col].strip().upper())
-            ok = True
-        except (ValueError, KeyError, AttributeError):
-            ok = False
-        return ok
-
-
-    @staticmethod
-    def __soft_validate_gw(row, gw_col='gwcode', month_col=None):
-        try:
-            if month_col is not None:
-                _ = Country.from_gwcode(int(row[gw_col]), int(row[month_col]))
-            else:
-                _ = Country.from_gwcode(int(row[gw_col]))
-            ok = True
-        except (ValueError, KeyError, AttributeError):
-            ok = False
-        return ok
+        key = _results.fingerprint(obj.c_id)
+        if key is not None and _results.get(('c_valid',) + key):
+            return
+        if not Country.exist(obj.c_id).all():
+            raise ValueError("No such country exists!")
+        if key is not None:
+            _results.put(('c_valid',) + key, True)
 
     @classmethod
     def soft_validate_iso(cls, df, iso_col='iso', month_col=None):
@@ -80,8 +107,8 @@ class CAccessor:
         if z.shape[0] == 0:
             z['valid_id'] = None
             return z
-        soft_validator = partial(CAccessor.__soft_validate_iso, iso_col=iso_col, month_col=month_col)
-        z['valid_id'] = z.apply(soft_validator, axis=1)
+        _, valid = Country.isos2ids(z[iso_col], z[month_col] if month_col is not None else None)
+        z['valid_id'] = valid
         return z
 
     @classmethod
@@ -90,8 +117,8 @@ class CAccessor:
         if z.shape[0] == 0:
             z['valid_id'] = None
             return z
-        soft_validator = partial(CAccessor.__soft_validate_gw, gw_col=gw_col, month_col=month_col)
-        z['valid_id'] = z.apply(soft_validator, axis=1)
+        _, valid = Country.gwcodes2ids(z[gw_col], z[month_col] if month_col is not None else None)
+        z['valid_id'] = valid
         return z
 
     @staticmethod
@@ -99,11 +126,24 @@ class CAccessor:
         if not(1 <= month <= 12):
             raise ValueError(f"Month {month} should be between 1 and 12!")
 
-        df['__z_local_month_id'] = df.apply(lambda row: ViewsMonth.from_year_month(year=row[year_col],
-                                                                              month=month).id,
-                                     axis=1)
+        month_id, valid = ViewsMonth.year_month2id_array(pd.to_numeric(df[year_col], errors='coerce'), month)
+        df['__z_local_month_id'] = np.where(valid, month_id, np.nan)
         return df
 
+    @staticmethod
+    def __hard_extids2ids(df, resolver, code_col, month_col=None):
+        """
+        Resolves a column of alternate country codes to c_ids, crashing with ValueError on the first row
+        that does not resolve, like the per-row Country factories do.
+        """
+        month_ids = df[month_col] if month_col is not None else None
+        c_id, valid = resolver(df[code_col], month_ids)
+        if not valid.all():
+            bad = df[~valid].iloc[0]
+            at_month = f' at month {bad[month_col]}' if month_col is not None else ''
+            raise ValueError(f"Country with code = {bad[code_col]} does not exist{at_month}!")
+        return c_id
+
     @classmethod
     def soft_validate_gwcode_year(cls, df, gw_col:str, year_col:str, at_month:int):
         z = CAccessor.make_helper_column(df=df.copy(), year_col=year_col, month=at_month)
@@ -124,62 +164,107 @@ class CAccessor:
         if z.shape[0] == 0:
             z['valid_id'] = None
             return z
-        z['valid_id'] = df.apply(CAccessor.__soft_validate, axis=1)
+        z['valid_id'] = CAccessor._soft_mask(z)
         return z
 
+    @staticmethod
+    def _soft_mask(df):
+        """
+        The vectorized soft-validation mask behind soft_validate.
+        """
+        return Country.exist(df.c_id)
+
+    def attributes(self, attributes):
+        """
+        Looks up several country attributes at once, e.g. df.c.attributes(['name', 'isoab', 'month_start']).
+        :param attributes: A list of Country attribute names, see Country.ATTRIBUTES
+        :return: A dataframe with one column per attribute, indexed like the original dataframe.
+        """
+        attributes = [attributes] if isinstance(attributes, str) else list(attributes)
+        key = _results.fingerprint(self._obj.c_id)
+        columns = {}
+        if key is not None:
+            columns = {attribute: _results.get(('c_attr', attribute) + key) for attribute in attributes}
+        missing = [attribute for attribute in attributes if columns.get(attribute) is None]
+        if missing:
+            looked_up = Country.lookup(self._obj.c_id, missing)
+            for attribute in missing:
+                columns[attribute] = looked_up[attribute].array
+                if key is not None:
+                    _results.put(('c_attr', attribute) + key, columns[attribute])
+        return pd.DataFrame({attribute: columns[attribute] for attribute in attributes}, index=self._obj.index)
+
+    def __attribute(self, attribute):
+        return self.attributes([attribute])[attribute].rename(None)
+
     @property
     def name(self):
-        return self._obj.apply(lambda row: Country(row.c_id).name, axis=1)
+        return self.__attribute('name')
 
     @property
     def gwcode(self):
-        return self._obj.apply(lambda row: Country(row.c_id).gwcode, axis=1)
+        return self.__attribute('gwcode')
 
     @property
     def isoab(self):
-        return self._obj.apply(lambda row: Country(row.c_id).isoab, axis=1)
+        return self.__attribute('isoab')
 
     @property
     def isonum(self):
-        return self._obj.apply(lambda row: Country(row.c_id).isonum, axis=1)
+        return self.__attribute('isonum')
 
     @property
     def capname(self):
-        return self._obj.apply(lambda row: Country(row.c_id).capname, axis=1)
+        return self.__attribute('capname')
 
     @property
     def caplat(self):
-        return self._obj.apply(lambda row: Country(row.c_id).caplat, axis=1)
+        return self.__attribute('caplat')
 
     @property
     def caplong(self):
-        return self._obj.apply(lambda row: Country(row.c_id).caplong, axis=1)
+        return self.__attribute('caplong')
 
     @property
     def in_africa(self):
-        return self._obj.apply(lambda row: Country(row.c_id).in_africa, axis=1)
+        return self.__attribute('in_africa')
 
     @property
     def in_me(self):
-        return self._obj.apply(lambda row: Country(row.c_id).in_me, axis=1)
+        return self.__attribute('in_me')
 
     @property
     def month_start(self):
-        return self._obj.apply(lambda row: Country(row.c_id).month_start, axis=1)
+        return self.__attribute('month_start')
 
     @property
     def month_end(self):
-        return self._obj.apply(lambda row: Country(row.c_id).month_end, axis=1)
+        return self.__attribute('month_end')
 
     @property
     def pg_id(self):
         """
         Explodes a data frame at c/cm/cy level to the corresponding pg/pgm/pgy level maintaining all values intact.
+        Each country is exploded to every priogrid it ever covered, see explode_pg for a time-aware explode.
         :return: A pg/pgm/pgy data frame containing the same data.
         """
-        z = self._obj.copy().drop_duplicates()
-        z['pg_id'] = z.apply(lambda x: [j.id for j in Country(x.c_id).priogrids()], axis=1)
-        z = z.explode('pg_id')
+        return self.explode_pg()
+
+    def explode_pg(self, year=None):
+        """
+        Explodes a data frame at c/cm/cy level to the corresponding pg/pgm/pgy level maintaining all values intact.
+        :param year: None to explode each country to every priogrid it ever covered.
+        A year scalar, or a column of years aligned with the data frame (e.g. df.year_id or df.cm.year)
+        to explode each country to the priogrids it covered in that year.
+        :return: A pg/pgm/pgy data frame containing the same data. Rows whose country covers no priogrid are dropped.
+        """
+        keep = ~self._obj.duplicated().values
+        z = self._obj[keep]
+        if year is not None and np.ndim(year) > 0:
+            year = np.asarray(year)[keep]
+        positions, pg_ids = Country.explode_priogrids(z.c_id, year)
+        z = z.iloc[positions]
+        z['pg_id'] = pg_ids.astype('int64')
         return z
 
     @classmethod
@@ -202,11 +287,7 @@ class CAccessor:
         if z.shape[0] == 0:
             z['c_id'] = None
             return z
-        if month_col is None:
-            z['c_id'] = z.apply(lambda row: Country.from_iso(iso=row[iso_col].strip().upper()).id, axis=1)
-        else:
-            z['c_id'] = z.apply(lambda row: Country.from_iso(iso=row[iso_col].strip().upper(),
-                                                              month_id=int(row[month_col])).id, axis=1)
+        z['c_id'] = CAccessor.__hard_extids2ids(z, Country.isos2ids, iso_col, month_col)
         return z
 
     @classmethod
@@ -215,13 +296,7 @@ class CAccessor:
         if z.shape[0] == 0:
             z['c_id'] = None
             return z
-        if month_col is None:
-            z['c_id'] = z.apply(lambda row: Country.from_gwcode(gwcode=row[gw_col]).id, axis=1)
-        else:
-            z['c_id'] = z.apply(lambda row: Country.from_gwcode(gwcode=int(row[gw_col]),
-                                                                 month_id=int(row[month_col])).id,
-                                 axis=1)
-
+        z['c_id'] = CAccessor.__hard_extids2ids(z, Country.gwcodes2ids, gw_col, month_col)
         return z
 
     @classmethod
@@ -231,9 +306,7 @@ class CAccessor:
             z['c_id'] = None
             return z
         z = CAccessor.make_helper_column(df=df.copy(), year_col=year_col, month=at_month)
-        z['c_id'] = z.apply(lambda row: Country.from_iso(iso=row[iso_col].strip().upper(),
-                                                          month_id=int(row['__z_local_month_id']))
-                             .id, axis=1)
+        z['c_id'] = CAccessor.__hard_extids2ids(z, Country.isos2ids, iso_col, '__z_local_month_id')
         del z['__z_local_month_id']
         return z
 
@@ -244,9 +317,7 @@ class CAccessor:
             z['c_id'] = None
             return z
         z = CAccessor.make_helper_column(df=df.copy(), year_col=year_col, month=at_month)
-        z['c_id'] = z.apply(lambda row: Country.from_gwcode(gwcode=row[gw_col],
-                                                             month_id=int(row['__z_local_month_id']))
-                             .id, axis=1)
+        z['c_id'] = CAccessor.__hard_extids2ids(z, Country.gwcodes2ids, gw_col, '__z_local_month_id')
         del z['__z_local_month_id']
         return z
 
@@ -265,6 +336,55 @@ class CAccessor:
         return me[me.c.in_me]
 
 
+    @staticmethod
+    def _panel_report(obj, time_col, start_attribute, end_attribute):
+        """
+        Per-country panel diagnostics, as one groupby aggregation joined against the country lifespans.
+        A country breaks the panel if it starts late, ends early or has gaps, all relative to both the extent
+        of the data frame and the lifespan of the country.
+        :param obj: A data frame with a c_id and a time column
+        :param time_col: The time column, e.g. month_id
+        :param start_attribute: The Country attribute where the lifespan starts, e.g. month_start
+        :param end_attribute: The Country attribute where the lifespan ends, e.g. month_end
+        :return: A data frame indexed by c_id, with an is_panel column and the diagnostics behind it.
+        """
+        first = obj[time_col].min()
+        last = obj[time_col].max()
+        report = obj.groupby('c_id')[time_col].agg(['min', 'max', 'size'])
+        lifespan = Country.lookup(report.index, [start_attribute, end_attribute]).set_axis(report.index)
+        report['start'] = lifespan[start_attribute]
+        report['end'] = lifespan[end_attribute]
+        report['expected'] = report.end.clip(upper=last) - report.start.clip(lower=first) + 1
+        report['late_start'] = (report['min'] > first) & (report['min'] > report.start)
+        report['early_end'] = (report['max'] < last) & (report['max'] < report.end)
+        report['gaps'] = (report['size'] != last - first + 1) & (report['size'] != report.expected)
+        report['is_panel'] = ~(report.late_start | report.early_end | report.gaps)
+        return report
+
+    @staticmethod
+    def _expand_lifespans(c_ids, time_col, start_attribute, end_attribute, min_time, max_time):
+        """
+        Builds the (c_id, time) scaffold covering the lifespan of each country, clipped to [min_time, max_time],
+        in one vectorized step.
+        :param c_ids: The countries to expand. Duplicates are ignored.
+        :param time_col: The name of the time column to produce, e.g. month_id
+        :param start_attribute: The Country attribute where the lifespan starts, e.g. month_start
+        :param end_attribute: The Country attribute where the lifespan ends, e.g. month_end
+        :return: A data frame with c_id and time_col columns, ordered by country and time.
+        """
+        c_ids = pd.unique(np.asarray(c_ids, dtype='int64'))
+        lifespan = Country.lookup(c_ids, [start_attribute, end_attribute])
+        start = lifespan[start_attribute].to_numpy(dtype='float64', na_value=np.nan)
+        end = lifespan[end_attribute].to_numpy(dtype='float64', na_value=np.nan)
+        # Countries without a lifespan (e.g. c_id 0, terra nullius) get no rows.
+        known = ~np.isnan(start) & ~np.isnan(end)
+        low = np.maximum(np.where(known, start, 0).astype('int64'), min_time)
+        high = np.minimum(np.where(known, end, 0).astype('int64'), max_time)
+        lengths = np.where(known, np.clip(high - low + 1, 0, None), 0)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return pd.DataFrame({'c_id': np.repeat(c_ids, lengths),
+                             time_col: np.repeat(low, lengths) + offsets})
+
     def db_id(self):
         return self._obj
 
@@ -346,7 +466,7 @@ class PgAccessor:
         Computes the latitude of the centroid of each dataframe row, per priogrid definitions.
         :return: A latitude in WGS-84 format (decimal degrees).
         """
-        return self._obj.apply(lambda x: Priogrid(x.pg_id).lat, axis=1)
+        return pd.Series(Priogrid.id2lat_array(self._obj.pg_id), index=self._obj.index)
 
     @property
     def lon(self):
@@ -354,24 +474,33 @@ class PgAccessor:
         Computes the longitude of the centroid of each dataframe row, per priogrid definitions.
         :return: A longitude in WGS-84 format (decimal degrees)
         """
-        return self._obj.apply(lambda x: Priogrid(x.pg_id).lon, axis=1)
+        return pd.Series(Priogrid.id2lon_array(self._obj.pg_id), index=self._obj.index)
 
 
     @property
     def row(self):
         """
         Computes the row of the centroid of each dataframe row, per priogrid definitions.
-        :return: A longitude in WGS-84 format (decimal degrees)
+        :return: A priogrid row
         """
-        return self._obj.apply(lambda x: Priogrid(x.pg_id).row, axis=1)
+        return pd.Series(Priogrid.id2row_array(self._obj.pg_id), index=self._obj.index)
 
     @property
     def col(self):
         """
         Computes the col of the centroid of each dataframe row, per priogrid definitions.
-        :return: A longitude in WGS-84 format (decimal degrees)
+        :return: A priogrid col
+        """
+        return pd.Series(Priogrid.id2col_array(self._obj.pg_id), index=self._obj.index)
+
+    @property
+    def geometry(self):
+        """
+        Computes row, col, lat and lon of each dataframe row in one pass over the pg_id column.
+        :return: A dataframe with row, col, lat and lon columns, indexed like the original dataframe.
         """
-        return self._obj.apply(lambda x: Priogrid(x.pg_id).col, axis=1)
+        row, col, lat, lon = Priogrid.id2geometry_array(self._obj.pg_id)
+        return pd.DataFrame({'row': row, 'col': col, 'lat': lat, 'lon': lon}, index=self._obj.index)
 
     def db_id(self):
         return self._obj
@@ -380,17 +509,17 @@ class PgAccessor:
     def c_id(self):
         """
         Returns a column containing country corresponding to the priogrid in the current panel (at present)
-        :return: A column of ViEWS country IDs
+        :return: A column of ViEWS country IDs, 0 for terra nullius
         """
-        return self._obj.apply(lambda row: Country.from_priogrid(row.pg_id).id, axis=1)
+        return pd.Series(Country.priogrids2ids(self._obj.pg_id), index=self._obj.index)
 
     def c_id_at_year(self, year):
         """
         Returns the country corresponding to a priogrid in a given year
         :param year: A year scalar, e.g. 1989
-        :return: A column of ViEWS country IDs
+        :return: A column of ViEWS country IDs, 0 for terra nullius
         """
-        return self._obj.apply(lambda row: Country.from_priogrid(row.pg_id, year).id, axis=1)
+        return pd.Series(Country.priogrids2ids(self._obj.pg_id, year), index=self._obj.index)
 
 
     @classmethod
@@ -409,17 +538,18 @@ class PgAccessor:
         if z.shape[0] == 0:
             z['pg_id'] = None
             return z
-        z['pg_id'] = df.apply(lambda row: Priogrid.latlon2id(lat=row[lat_col], lon=row[lon_col]), axis=1)
+        pg_id, valid = PgAccessor.__latlon2id(z, lat_col=lat_col, lon_col=lon_col)
+        if not valid.all():
+            raise ValueError(f"{(~valid).sum()} rows have latitudes outside [-90;90] "
+                             f"or longitudes outside [-180;180] (or are null)!")
+        z['pg_id'] = pg_id
         return z
 
     @staticmethod
-    def __soft_validate_row(row):
-        try:
-            _ = Priogrid(int(row['pg_id']))
-            ok = True
-        except:
-            ok = False
-        return ok
+    def __latlon2id(df, lat_col, lon_col):
+        lat = pd.to_numeric(df[lat_col], errors='coerce')
+        lon = pd.to_numeric(df[lon_col], errors='coerce')
+        return Priogrid.latlon2id_array(lat, lon)
 
     @classmethod
     def soft_validate(cls, df):
@@ -427,18 +557,17 @@ class PgAccessor:
         if z.shape[0] == 0:
             z['valid_id'] = None
             return z
-        z['valid_id'] = z.apply(PgAccessor.__soft_validate_row, axis=1)
+        z['valid_id'] = PgAccessor._soft_mask(z)
         return z
 
-
     @staticmethod
-    def __soft_validate_pg(row, lat_col, lon_col):
-        try:
-            _ = Priogrid.latlon2id(lat=row[lat_col], lon=row[lon_col])
-            ok = True
-        except ValueError:
-            ok = False
-        return ok
+    def _soft_mask(df):
+        """
+        The vectorized soft-validation mask behind soft_validate.
+        """
+        pg_id = pd.to_numeric(df.pg_id, errors='coerce')
+        return ((0 <= pg_id) & (pg_id <= 259200)).values
+
 
     @classmethod
     def soft_validate_latlon(cls, df, lat_col='lat', lon_col='lon'):
@@ -453,10 +582,100 @@ class PgAccessor:
         if z.shape[0] == 0:
             z['valid_latlon'] = None
             return z
-        soft_validator = partial(PgAccessor.__soft_validate_pg, lat_col=lat_col, lon_col=lon_col)
-        z['valid_latlon'] = z.apply(soft_validator, axis=1)
+        _, valid = PgAccessor.__latlon2id(z, lat_col=lat_col, lon_col=lon_col)
+        z['valid_latlon'] = valid
         return z
 
+    @staticmethod
+    def _panel_report(obj, time_col):
+        """
+        Per-period panel diagnostics from a single sort of the (period, pg_id) pairs.
+        Each period's sorted cell set is compared against that of the first period.
+        :param obj: A data frame with a pg_id and a time column
+        :param time_col: The time column, e.g. month_id
+        :return: A data frame indexed by every period between the first and last period of the data frame,
+        with the number of cells in the period and whether its cell set equals that of the first period (is_panel).
+        Periods absent from the data frame have 0 cells. Rows with a null pg_id or time are ignored.
+        """
+        obj = obj[obj['pg_id'].notna() & obj[time_col].notna()]
+        if obj.shape[0] == 0:
+            return pd.DataFrame({'cells': np.zeros(0, dtype='int64'), 'is_panel': np.zeros(0, dtype=bool)},
+                                index=pd.Index([], dtype='int64', name=time_col))
+        time = obj[time_col].values.astype('int64')
+        first = time.min()
+        n_periods = time.max() - first + 1
+        pairs = np.sort((time - first) * 259201 + obj.pg_id.values.astype('int64'))
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+        periods, cells = np.divmod(pairs, 259201)
+        counts = np.bincount(periods, minlength=n_periods)
+        starts = np.cumsum(counts) - counts
+        is_panel = counts == counts[0]
+        candidates = np.flatnonzero(is_panel)
+        block = cells[starts[candidates][:, None] + np.arange(counts[0])]
+        is_panel[candidates] = (block == cells[:counts[0]]).all(axis=1)
+        return pd.DataFrame({'cells': counts, 'is_panel': is_panel},
+                            index=pd.Index(np.arange(first, first + n_periods), name=time_col))
+
+    @staticmethod
+    def _fill_product(obj, outer_col, outer, inner_col, inner, fill_value=None, start=0):
+        """
+        Left-joins a data frame onto the cartesian product of two key arrays (outer-major), i.e. what a 'key': 0
+        cross merge followed by a left merge produces. Each output column is taken straight from the data with
+        a single indexer, so no intermediate frames bigger than the output are created.
+        :param obj: A data frame with a pg_id and a time column
+        :param outer_col: The name of the outer (slow-varying) key column
+        :param outer: The outer key values
+        :param inner_col: The name of the inner (fast-varying) key column
+        :param inner: The inner key values
+        :param fill_value: If not None, nulls in the output are replaced with this value
+        :param start: The first label of the output RangeIndex
+        :return: A data frame with pg_id, the time column and the remaining columns of obj.
+        """
+        outer = np.asarray(outer)
+        inner = np.asarray(inner)
+        keys = ['pg_id'] + [col for col in (outer_col, inner_col) if col != 'pg_id']
+        columns = [col for col in obj.columns if col not in keys]
+        outer_codes = pd.Index(outer).get_indexer(obj[outer_col])
+        inner_codes = pd.Index(inner).get_indexer(obj[inner_col])
+        rows = np.flatnonzero((outer_codes >= 0) & (inner_codes >= 0))
+        positions = outer_codes[rows] * inner.shape[0] + inner_codes[rows]
+        indexer = np.full(outer.shape[0] * inner.shape[0], -1, dtype='intp')
+        indexer[positions] = rows
+        scaffold = {outer_col: np.repeat(outer, inner.shape[0]), inner_col: np.tile(inner, outer.shape[0])}
+        extent = pd.DataFrame({key: scaffold[key] for key in keys},
+                              index=pd.RangeIndex(start, start + indexer.shape[0]))
+        del scaffold
+        if (indexer[positions] != rows).any():
+            # Duplicate keys in the data expand the output, which only a real merge reproduces.
+            extent = extent.merge(obj, how='left', on=keys)
+            extent.index = extent.index + start
+            if fill_value is not None:
+                for col in columns:
+                    extent[col] = extent[col].fillna(fill_value)
+        else:
+            for col in columns:
+                values = pd.Series(pd.api.extensions.take(obj[col].array, indexer, allow_fill=True),
+                                   index=extent.index, copy=False)
+                # Filling column by column keeps the peak at one extra column rather than a copy of the output.
+                extent[col] = values if fill_value is None else values.fillna(fill_value)
+        return extent
+
+    @staticmethod
+    def _iter_fill_product(obj, outer_col, outer, inner_col, inner, chunk_size, fill_value=None):
+        """
+        Chunked _fill_product, yielding the output in slices of chunk_size outer keys.
+        Concatenating all chunks gives the same data frame as _fill_product.
+        """
+        outer = np.asarray(outer)
+        inner = np.asarray(inner)
+        outer_codes = pd.Index(outer).get_indexer(obj[outer_col])
+        order = np.argsort(outer_codes, kind='stable')
+        bounds = np.searchsorted(outer_codes[order], np.arange(0, outer.shape[0] + chunk_size, chunk_size))
+        for i, first in enumerate(range(0, outer.shape[0], chunk_size)):
+            chunk = obj.iloc[order[bounds[i]:bounds[i + 1]]]
+            yield PgAccessor._fill_product(chunk, outer_col, outer[first:first + chunk_size], inner_col, inner,
+                                           fill_value=fill_value, start=first * inner.shape[0])
+
     def full_set(self, land_only=True):
         x = self._obj
         ctrl_grids = set(range(1, 259201))
@@ -466,32 +685,49 @@ class PgAccessor:
             return True
         return False
 
-    def get_bbox(self, only_views_cells=False):
-        test_square = self._obj
-        min_row = test_square.pg.row.min()
-        max_row = test_square.pg.row.max()
-        min_col = test_square.pg.col.min()
-        max_col = test_square.pg.col.max()
-        square = []
-        for row in range(min_row, max_row + 1):
-            for col in range(min_col, max_col + 1):
-                square += [Priogrid.from_row_col(row=row, col=col).id]
-        square = set(square)
+    @staticmethod
+    @memory_tier(maxsize=1)
+    def _land_mask():
+        """
+        A boolean mask over all possible priogrid ids (0..259200), True for the cells present in the views DB.
+        :return: A read-only numpy array of 259201 bools
+        """
+        mask = np.zeros(259201, dtype=bool)
+        mask[np.asarray(fetch_ids('priogrid')[0], dtype='int64')] = True
+        mask.flags.writeable = False
+        return mask
+
+    @staticmethod
+    @memory_tier(maxsize=16)
+    def _bbox_ids(min_row, max_row, min_col, max_col, only_views_cells):
+        ids = Priogrid.bbox_array(min_row, max_row, min_col, max_col)
         if only_views_cells:
-            views_cells, _ = fetch_ids('priogrid')
-            square = set(views_cells).intersection(square)
-        return square
+            ids = ids[PgAccessor._land_mask()[ids]]
+        ids.flags.writeable = False
+        return ids
+
+    def _bbox(self, only_views_cells=False):
+        """
+        The bounding box of the df, as a sorted array of pg_ids.
+        Boxes are cached by extent, so is_bbox, fill_bbox etc. on the same extent only build it once.
+        :param only_views_cells: Only keep the cells present in the views DB (i.e. land cells)
+        :return: A read-only, sorted numpy array of priogrid ids
+        """
+        rows, cols = np.divmod(self._obj.pg_id.to_numpy(dtype='int64'), 720)
+        return PgAccessor._bbox_ids(int(rows.min()) + 1, int(rows.max()) + 1, int(cols.min()), int(cols.max()),
+                                    bool(only_views_cells))
+
+    def get_bbox(self, only_views_cells=False):
+        return set(self._bbox(only_views_cells=only_views_cells).tolist())
 
     def is_bbox(self, only_views_cells=False):
-        square = self.get_bbox(only_views_cells=only_views_cells)
-        return square == set(self._obj.pg_id)
+        square = self._bbox(only_views_cells=only_views_cells)
+        return np.array_equal(np.sort(pd.unique(self._obj.pg_id.to_numpy())), square)
 
     def fill_bbox(self, fill_value=None):
-        extent = pd.DataFrame({'pg_id': list(self.get_bbox())}).merge(self._obj, how='left', on='pg_id')
-        if 'pgm_id' in self._obj:
-            extent = PGMAccessor.__db_id(extent)
+        extent = pd.DataFrame({'pg_id': self._bbox()}).merge(self._obj, how='left', on='pg_id')
         if fill_value is not None:
-            extent = extent.fillna(extent)
+            extent = extent.fillna(fill_value)
         return extent
 
 
@@ -523,11 +759,25 @@ class MAccessor():
 
     @property
     def year(self):
-        return self._obj.apply(lambda x: ViewsMonth(x.month_id).year, axis=1)
+        return pd.Series(ViewsMonth.id2year_array(self._obj.month_id), index=self._obj.index)
 
     @property
     def month(self):
-        return self._obj.apply(lambda x: ViewsMonth(x.month_id).month, axis=1)
+        return pd.Series(ViewsMonth.id2month_array(self._obj.month_id), index=self._obj.index)
+
+    @staticmethod
+    def __year_month2id(year, month):
+        year = pd.to_numeric(year, errors='coerce')
+        month = pd.to_numeric(month, errors='coerce')
+        return ViewsMonth.year_month2id_array(year, month)
+
+    @staticmethod
+    def __hard_year_month2id(year, month):
+        month_id, valid = MAccessor.__year_month2id(year, month)
+        if not valid.all():
+            raise ValueError(f"{(~valid).sum()} rows have years before 1980 "
+                             f"or months outside 1..12 (or are null)!")
+        return month_id
 
     @classmethod
     def from_year_month(cls, df, year_col='year', month_col='month'):
@@ -536,9 +786,7 @@ class MAccessor():
             z['month_id'] = None
             return z
 
-        z['month_id'] = z.apply(lambda row: ViewsMonth.from_year_month(year=row[year_col],
-                                                                       month=row[month_col]).id,
-                                axis=1)
+        z['month_id'] = MAccessor.__hard_year_month2id(z[year_col], z[month_col])
         return z
 
     @classmethod
@@ -548,13 +796,13 @@ class MAccessor():
             z['month_id'] = None
             return z
 
-        z['temp_year_col'] = z[datetime_col].dt.year
-        z['temp_month_col'] = z[datetime_col].dt.month
-        z['month_id'] = z.apply(lambda row: ViewsMonth.from_year_month(year=row['temp_year_col'],
-                                                                       month=row['temp_month_col']).id,
-                                axis=1)
-        del z["temp_year_col"]
-        del z["temp_month_col"]
+        if pd.api.types.is_datetime64_dtype(z[datetime_col]):
+            month_id, valid = ViewsMonth.datetime2id_array(z[datetime_col])
+            if not valid.all():
+                raise ValueError(f"{(~valid).sum()} rows have dates before 1980 (or are null)!")
+        else:
+            month_id = MAccessor.__hard_year_month2id(z[datetime_col].dt.year, z[datetime_col].dt.month)
+        z['month_id'] = month_id
         return z
 
     def db_id(self):
@@ -565,33 +813,22 @@ class MAccessor():
         extent = extent.merge(self._obj, how='left', on=['month_id'])
         return extent
 
-    @staticmethod
-    def __soft_validate(row):
-        try:
-            if 0 < row['month_id'] < 1000:
-                return True
-            else:
-                return False
-        except:
-            return False
-
     @classmethod
     def soft_validate(cls, df):
         z = df.copy()
         if z.shape[0] == 0:
             z['valid_id'] = None
             return z
-        z['valid_id'] = z.apply(MAccessor.__soft_validate, axis=1)
+        z['valid_id'] = MAccessor._soft_mask(z)
         return z
 
     @staticmethod
-    def __soft_validate_month(row, year_col, month_col):
-        try:
-            _ = ViewsMonth.from_year_month(year=row[year_col], month=row[month_col]).id
-            ok = True
-        except ValueError:
-            ok = False
-        return ok
+    def _soft_mask(df):
+        """
+        The vectorized soft-validation mask behind soft_validate.
+        """
+        month_id = pd.to_numeric(df.month_id, errors='coerce')
+        return ((0 < month_id) & (month_id < 1000)).values
 
     @classmethod
     def soft_validate_year_month(cls, df, year_col='year', month_col='month'):
@@ -599,8 +836,8 @@ class MAccessor():
         if z.shape[0] == 0:
             z['valid_year_month'] = None
             return z
-        soft_validator = partial(MAccessor.__soft_validate_month, year_col=year_col, month_col=month_col)
-        z['valid_year_month'] = z.apply(soft_validator, axis=1)
+        _, valid = MAccessor.__year_month2id(z[year_col], z[month_col])
+        z['valid_year_month'] = valid
         return z
 
     def full_set(self, max_month=None):
@@ -622,29 +859,22 @@ class CYAccessor(CAccessor):
     def __init__(self, pandas_obj):
         super().__init__(pandas_obj)
 
-    @staticmethod
-    def __soft_validate(row):
-        try:
-            cntry = Country(int(row.c_id))
-            # Some countries begin before the ViEWS Epoch
-            if cntry.month_start <= 0:
-                cntry.month_start = 1
-            # If the year in the row is within the country's existence, we are fine.
-            if int(row.year_id) in range(ViewsMonth(cntry.month_start).year, ViewsMonth(cntry.month_end).year+1):
-                ok = True
-            else:
-                ok = False
-        except ValueError:
-            ok = False
-        return ok
-
     @classmethod
     def soft_validate(cls, df):
         z = df.copy()
         if z.shape[0] == 0:
             z['valid_id'] = None
             return z
-        z['valid_id'] = df.apply(CYAccessor.__soft_validate, axis=1)
+        c_id = pd.to_numeric(z.c_id, errors='coerce')
+        year_id = pd.to_numeric(z.year_id, errors='coerce').values
+        valid = Country.exist(c_id) & (c_id != 0).values
+        lifespan = Country.lookup(np.where(valid, c_id, 0), ['month_start', 'month_end'])
+        # Some countries begin before the ViEWS Epoch
+        month_start = lifespan.month_start.clip(lower=1).fillna(1).values
+        month_end = lifespan.month_end.fillna(0).values
+        z['valid_id'] = (valid & (month_end > 0) &
+                         (ViewsMonth.id2year_array(month_start) <= year_id) &
+                         (year_id <= ViewsMonth.id2year_array(np.maximum(month_end, 1))))
         return z
 
     @property
@@ -655,25 +885,20 @@ class CYAccessor(CAccessor):
             return True
         return False
 
+    def panel_report(self):
+        """
+        Per-country panel diagnostics, see is_panel.
+        :return: A data frame indexed by c_id, with the first (min), last (max) and number (size) of years
+        of each country, its lifespan (start, end), the flags late_start, early_end and gaps and an is_panel column.
+        """
+        return CAccessor._panel_report(self._obj, 'year_id', 'year_start', 'year_end')
+
     def is_panel(self):
         """
-        Tests if the
+        Tests if the data frame is a panel, i.e. every country covers all years of the data frame,
+        except for years outside the lifespan of the country. Use panel_report to find the offending countries.
         """
-        test_square = self._obj.copy()
-        min_year = test_square.year_id.min()
-        max_year = test_square.year_id.max()
-        for cid in test_square.c_id.unique():
-            test_country = test_square[test_square.c_id == cid]
-            if test_country.year_id.min() > min_year and test_country.year_id.min() > Country(cid).year_start:
-                return False
-            if test_country.year_id.max() < max_year and test_country.year_id.max() < Country(cid).year_end:
-                return False
-            if len(test_country.index) != max_year - min_year + 1:
-                low = Country(cid).year_start if Country(cid).year_start > min_year else min_year
-                high = Country(cid).year_end if Country(cid).year_end < max_year else max_year
-                if high - low + 1 != len(test_country.index):
-                    return False
-        return True
+        return bool(self.panel_report().is_panel.all())
 
     def is_complete_time_series(self, min_year=1980, max_year=2040):
         test_square = self._obj.copy()
@@ -688,12 +913,8 @@ class CYAccessor(CAccessor):
             min_year = 1945
         if max_year is None:
             max_year = 2050
-        test_square = self._obj.copy()
-        extents = pd.DataFrame()
-        for cid in test_square.c_id.unique():
-            low = Country(cid).year_start if Country(cid).year_start > min_year else min_year
-            high = Country(cid).year_end if Country(cid).year_end < max_year else max_year
-            extents = extents.append(pd.DataFrame({'c_id': cid, 'year_id':range(low, high+1)}))
+        extents = CAccessor._expand_lifespans(self._obj.c_id, 'year_id', 'year_start', 'year_end',
+                                              min_time=min_year, max_time=max_year)
         extents = extents.merge(self._obj, how='left', on=['c_id', 'year_id'])
         #except KeyError:
         #    extents = extents.merge(self._obj, how='left', on=['c_id'])
@@ -766,35 +987,28 @@ class CMAccessor(CAccessor, MAccessor):
             return True
         return False
 
-    def is_panel(self):
+    def panel_report(self):
         """
-        Tests if the
+        Per-country panel diagnostics, see is_panel.
+        :return: A data frame indexed by c_id, with the first (min), last (max) and number (size) of months
+        of each country, its lifespan (start, end), the flags late_start, early_end and gaps and an is_panel column.
         """
-        test_square = self._obj.copy()
-        min_month = test_square.month_id.min()
-        max_month = test_square.month_id.max()
+        return CAccessor._panel_report(self._obj, 'month_id', 'month_start', 'month_end')
 
-        for cid in test_square.c_id.unique():
-            test_country = test_square[test_square.c_id == cid]
-            if test_country.month_id.min() > min_month and test_country.month_id.min() > Country(cid).month_start:
-                return False
-            if test_country.month_id.max() < max_month and test_country.month_id.max() < Country(cid).month_end:
-                return False
-            if len(test_country.index) != max_month - min_month + 1:
-                low = Country(cid).month_start if Country(cid).month_start > min_month else min_month
-                high = Country(cid).month_end if Country(cid).month_end < max_month else max_month
-                if high - low + 1 != len(test_country.index):
-                    return False
-        return True
+    def is_panel(self):
+        """
+        Tests if the data frame is a panel, i.e. every country covers all months of the data frame,
+        except for months outside the lifespan of the country. Use panel_report to find the offending countries.
+        """
+        return bool(self.panel_report().is_panel.all())
 
     @classmethod
     def soft_validate(cls, df):
-        z = CAccessor.soft_validate(df)
-        z['valid_id_0'] = z['valid_id']
-        del z['valid_id']
-        z = MAccessor.soft_validate(z)
-        z['valid_id'] = z['valid_id'] & z['valid_id_0']
-        del z['valid_id_0']
+        z = df.copy()
+        if z.shape[0] == 0:
+            z['valid_id'] = None
+            return z
+        z['valid_id'] = CAccessor._soft_mask(z) & MAccessor._soft_mask(z)
         return z
 
 
@@ -811,12 +1025,8 @@ class CMAccessor(CAccessor, MAccessor):
             min_month = 1
         if max_month is None:
             max_month = 999
-        test_square = self._obj.copy()
-        extents = pd.DataFrame()
-        for cid in test_square.c_id.unique():
-            low = Country(cid).month_start if Country(cid).month_start > min_month else min_month
-            high = Country(cid).month_end if Country(cid).month_end < max_month else max_month
-            extents = extents.append(pd.DataFrame({'c_id': cid, 'month_id':range(low, high+1)}))
+        extents = CAccessor._expand_lifespans(self._obj.c_id, 'month_id', 'month_start', 'month_end',
+                                              min_time=min_month, max_time=max_month)
         extents = extents.merge(self._obj, how='left', on=['c_id', 'month_id'])
         #except KeyError:
         #    extents = extents.merge(self._obj, how='left', on=['c_id'])
@@ -908,6 +1118,66 @@ class CMAccessor(CAccessor, MAccessor):
         z = super().from_iso(z, iso_col=iso_col, month_col='month_id')
         return z
 
+    def explode_neighbors(self):
+        """
+        Explodes a cm data frame to one row per (country-month, first-order neighbor in that month) pair,
+        maintaining all values intact.
+        :return: The data frame with a neighbor_id column holding the c_id of the neighbor.
+        Rows whose country has no neighbors in that month (e.g. islands) are dropped.
+        """
+        positions, b_ids = Country.explode_neighbors(self._obj.c_id, self._obj.month_id)
+        z = self._obj.iloc[positions]
+        z['neighbor_id'] = b_ids.astype('int64')
+        return z
+
+    def spatial_lag(self, column, how='sum'):
+        """
+        First-order spatial lag of a column, i.e. the sum, mean or max of the column across the neighbors
+        of each country in the same month, in one pass over the whole panel.
+        Neighbors that are not in the data frame, or where the column is NaN, are left out.
+        :param column: The name of a numeric column
+        :param how: One of 'sum', 'mean' or 'max'
+        :return: A float Series aligned with the data frame. Rows without any neighbor values get 0 for sum
+        and NaN for mean and max.
+        """
+        if how not in ('sum', 'mean', 'max'):
+            raise ValueError("how must be one of 'sum', 'mean' or 'max'")
+        n_rows = self._obj.shape[0]
+        c_ids = self._obj.c_id.to_numpy(dtype='int64')
+        month_ids = self._obj.month_id.to_numpy(dtype='int64')
+        values = self._obj[column].to_numpy(dtype='float64', na_value=np.nan)
+        positions, b_ids = Country.explode_neighbors(c_ids, month_ids)
+
+        # Find the row of each (neighbor, month) pair by binary search on the sorted (month, c_id) keys.
+        n_c = int(max(c_ids.max(initial=0), b_ids.max(initial=0))) + 1
+        keys = month_ids * n_c + c_ids
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        if (keys[1:] == keys[:-1]).any():
+            raise ValueError("spatial_lag needs a data frame with unique (c_id, month_id) rows!")
+        wanted = month_ids[positions] * n_c + b_ids
+        found = np.minimum(np.searchsorted(keys, wanted), max(n_rows - 1, 0))
+        lagged = np.full(positions.shape[0], np.nan)
+        matched = keys[found] == wanted if n_rows > 0 else np.zeros(0, dtype=bool)
+        lagged[matched] = values[order[found[matched]]]
+        keep = ~np.isnan(lagged)
+        positions, lagged = positions[keep], lagged[keep]
+
+        sums = np.bincount(positions, weights=lagged, minlength=n_rows)
+        if how == 'sum':
+            result = sums
+        elif how == 'mean':
+            counts = np.bincount(positions, minlength=n_rows)
+            result = np.full(n_rows, np.nan)
+            np.divide(sums, counts, out=result, where=counts > 0)
+        else:
+            # positions are sorted, so each row's neighbor values are a contiguous segment.
+            result = np.full(n_rows, np.nan)
+            if positions.shape[0] > 0:
+                starts = np.concatenate(([0], np.flatnonzero(positions[1:] != positions[:-1]) + 1))
+                result[positions[starts]] = np.maximum.reduceat(lagged, starts)
+        return pd.Series(result, index=self._obj.index, name=column)
+
     @staticmethod
     def __db_id(df):
         z = df.copy().reset_index(drop=True)
@@ -977,17 +1247,8 @@ class PGMAccessor(PgAccessor, MAccessor):
         if z.shape[0] == 0:
             z['valid_id'] = None
             return z
-        else:
-            z = PgAccessor.soft_validate(z)
-            z['valid_id_0'] = z.valid_id
-            del z['valid_id']
-            z = MAccessor.soft_validate(z)
-            z['valid_id_1'] = z.valid_id
-            del z['valid_id']
-            z['valid_id'] = z.valid_id_1 & z.valid_id_0
-            del z['valid_id_0']
-            del z['valid_id_1']
-            return z
+        z['valid_id'] = PgAccessor._soft_mask(z) & MAccessor._soft_mask(z)
+        return z
 
 
     def full_set(self, land_only=True, max_month=None):
@@ -995,18 +1256,21 @@ class PGMAccessor(PgAccessor, MAccessor):
         m_full_set = MAccessor(self._obj).full_set(max_month)
         return pg_full_set & m_full_set
 
+    def panel_report(self):
+        """
+        Per-month panel diagnostics, see is_panel.
+        :return: A data frame indexed by month_id, with the number of cells in each month
+        and whether the month has the same cells as the first month (is_panel).
+        """
+        return PgAccessor._panel_report(self._obj, 'month_id')
+
     def is_panel(self):
-        test_square = self._obj
-        min_month = test_square.month_id.min()
-        max_month = test_square.month_id.max()
-        if len(test_square.month_id.unique()) != max_month - min_month + 1:
-            return False
-        first_panel = set(test_square[test_square.month_id == min_month].pg_id.unique())
-        for month in test_square.month_id.unique():
-            cur_panel = set(test_square[test_square.month_id == month].pg_id.unique())
-            if first_panel != cur_panel:
-                return False
-        return True
+        """
+        Tests if the data frame is a panel, i.e. all months between the first and the last have the same cells.
+        Use panel_report to find the months that deviate.
+        """
+        report = self.panel_report()
+        return report.shape[0] > 0 and bool(report.is_panel.all())
 
     def is_complete_cross_section(self, only_views_cells=True):
         x = self._obj
@@ -1029,70 +1293,61 @@ class PGMAccessor(PgAccessor, MAccessor):
 
 
     def fill_panel_gaps(self, fill_value=None):
-        extent1 = pd.DataFrame({'month_id': range(self._obj.month_id.min(), self._obj.month_id.max() + 1), 'key': 0})
-        extent2 = pd.DataFrame({'key': 0, 'pg_id': self._obj.pg_id.unique()})
-        extent = extent1.merge(extent2, on='key')[['pg_id','month_id']]
-        extent = extent.merge(self._obj, how='left', on=['pg_id','month_id'])
+        months = np.arange(self._obj.month_id.min(), self._obj.month_id.max() + 1)
+        extent = PgAccessor._fill_product(self._obj, 'month_id', months, 'pg_id', self._obj.pg_id.unique(),
+                                          fill_value=fill_value)
         if 'pgm_id' in self._obj:
             extent = PGMAccessor.__db_id(extent)
-        if fill_value is not None:
-            extent = extent.fillna(fill_value)
         return extent
 
+    def iter_panel_gaps(self, chunk_size=12, fill_value=None):
+        """
+        Chunked fill_panel_gaps, yielding the filled panel chunk_size months at a time,
+        so that only one chunk needs to be in memory at once. Concatenating the chunks gives fill_panel_gaps().
+        :param chunk_size: The number of months per chunk
+        :param fill_value: If not None, nulls in the output are replaced with this value
+        :return: A generator of pgm data frames
+        """
+        months = np.arange(self._obj.month_id.min(), self._obj.month_id.max() + 1)
+        for extent in PgAccessor._iter_fill_product(self._obj, 'month_id', months, 'pg_id',
+                                                    self._obj.pg_id.unique(), chunk_size, fill_value=fill_value):
+            if 'pgm_id' in self._obj:
+                extent = PGMAccessor.__db_id(extent).set_axis(extent.index)
+            yield extent
+
     def fill_spatial_gaps(self, fill_value=None):
-        extent1 = pd.DataFrame({'pg_id': self._obj.pg_id.unique(), 'key': 0})
-        extent2 = pd.DataFrame({'key': 0, 'month_id': self._obj.month_id.unique()})
-        extent = extent1.merge(extent2, on='key')[['pg_id','month_id']]
-        extent = extent.merge(self._obj, how='left', on=['pg_id','month_id'])
+        extent = PgAccessor._fill_product(self._obj, 'pg_id', self._obj.pg_id.unique(),
+                                          'month_id', self._obj.month_id.unique(), fill_value=fill_value)
         if 'pgm_id' in self._obj:
             extent = PGMAccessor.__db_id(extent)
-        if fill_value is not None:
-            extent = extent.fillna(fill_value)
         return extent
 
     def fill_bbox(self, fill_value=None):
-        extent1 = pd.DataFrame({'pg_id': list(self.get_bbox()), 'key': 0})
-        extent2 = pd.DataFrame({'key': 0, 'month_id': list(self._obj.month_id.unique())})
-        extent3 = extent1.merge(extent2, on='key')[['pg_id','month_id']]
-        extent = extent3.merge(self._obj, how='left', on=['pg_id','month_id'])
+        extent = PgAccessor._fill_product(self._obj, 'pg_id', self._bbox(),
+                                          'month_id', self._obj.month_id.unique(), fill_value=fill_value)
         if 'pgm_id' in self._obj:
             extent = PGMAccessor.__db_id(extent)
-        if fill_value is not None:
-            extent = extent.fillna(fill_value)
         return extent
 
     @staticmethod
-    def __db_id(df):
-        z = df.copy().reset_index(drop=True)
-        db_ids = fetch_ids_df('priogrid_month')[['id', 'priogrid_gid', 'month_id']]
-        # These lines are not strictly needed but Pandas is not smart enough to do this on its own.
-        db_ids = db_ids[(db_ids.month_id >= z.month_id.min()) & (db_ids.month_id <= z.month_id.max())]
-        db_ids = db_ids[db_ids.priogrid_gid.isin(set(z.pg_id))]
-
-        try:
-            del z['id']
-        except:
-            pass
-
-        z['pgm_id'] = z.merge(db_ids,
-                              left_on=['pg_id', 'month_id'],
-                              right_on=['priogrid_gid', 'month_id'],
-                              how='left').id
-
-        return z
+    def __db_id(df, trim=False):
+        """
+        Attaches the pgm_id of each row, using the priogrid_month id matrix.
+        :param df: A pgm data frame
+        :param trim: If True, drop the rows that have no pgm_id instead of leaving them NaN
+        :return: A copy of df, with a fresh RangeIndex (before trimming) and a pgm_id column
+        """
+        z = df.reset_index(drop=True).drop(columns='id', errors='ignore')
+        ids, valid = lookup_ids('priogrid_month', z.pg_id, z.month_id)
+        if trim:
+            return z.assign(pgm_id=ids)[valid]
+        return z.assign(pgm_id=ids if valid.all() else np.where(valid, ids, np.nan))
 
     def db_id(self):
         return PGMAccessor.__db_id(self._obj)
 
     def trim_to_db_extent(self):
-        try:
-            del self._obj.pgm_id
-        except AttributeError:
-            pass
-        z = self.db_id()
-        z = z[z.pgm_id.notna()]
-        z['pgm_id'] = z.pgm_id.astype('int64')
-        return z
+        return PGMAccessor.__db_id(self._obj, trim=True)
 
         """Special method to attach"""
 
@@ -1117,24 +1372,29 @@ class PGYAccessor(PgAccessor):
 
     @classmethod
     def soft_validate(cls, df):
-        z = PgAccessor.soft_validate(df)
-        z['valid_year']=(1980 <= pd.to_numeric(z.year_id)) & (pd.to_numeric(z.year_id) <= 2100)
-        z['valid_id'] = z['valid_id'] & z['valid_year']
-        del z['valid_year']
+        z = df.copy()
+        if z.shape[0] == 0:
+            z['valid_id'] = None
+            return z
+        year_id = pd.to_numeric(z.year_id, errors='coerce')
+        z['valid_id'] = PgAccessor._soft_mask(z) & ((1980 <= year_id) & (year_id <= 2100)).values
         return z
 
+    def panel_report(self):
+        """
+        Per-year panel diagnostics, see is_panel.
+        :return: A data frame indexed by year_id, with the number of cells in each year
+        and whether the year has the same cells as the first year (is_panel).
+        """
+        return PgAccessor._panel_report(self._obj, 'year_id')
+
     def is_panel(self):
-        test_square = self._obj
-        min_year = test_square.year_id.min()
-        max_year = test_square.year_id.max()
-        if len(test_square.year_id.unique()) != max_year - min_year + 1:
-            return False
-        first_panel = set(test_square[test_square.year_id == min_year].pg_id.unique())
-        for year in test_square.year_id.unique():
-            cur_panel = set(test_square[test_square.year_id == year].pg_id.unique())
-            if first_panel != cur_panel:
-                return False
-        return True
+        """
+        Tests if the data frame is a panel, i.e. all years between the first and the last have the same cells.
+        Use panel_report to find the years that deviate.
+        """
+        report = self.panel_report()
+        return report.shape[0] > 0 and bool(report.is_panel.all())
 
     def is_complete_cross_section(self, only_views_cells=True):
         x = self._obj
@@ -1157,68 +1417,69 @@ class PGYAccessor(PgAccessor):
 
 
     def fill_panel_gaps(self, fill_value=None):
-        extent1 = pd.DataFrame({'year_id': range(self._obj.year_id.min(), self._obj.year_id.max() + 1), 'key': 0})
-        extent2 = pd.DataFrame({'key': 0, 'pg_id': self._obj.pg_id.unique()})
-        extent = extent1.merge(extent2, on='key')[['pg_id','year_id']]
-        extent = extent.merge(self._obj, how='left', on=['pg_id','year_id'])
+        years = np.arange(self._obj.year_id.min(), self._obj.year_id.max() + 1)
+        extent = PgAccessor._fill_product(self._obj, 'year_id', years, 'pg_id', self._obj.pg_id.unique(),
+                                          fill_value=fill_value)
         if 'pgy_id' in self._obj:
             extent = PGYAccessor.__db_id(extent)
-        if fill_value is not None:
-            extent = extent.fillna(fill_value)
         return extent
 
+    def iter_panel_gaps(self, chunk_size=1, fill_value=None):
+        """
+        Chunked fill_panel_gaps, yielding the filled panel chunk_size years at a time,
+        so that only one chunk needs to be in memory at once. Concatenating the chunks gives fill_panel_gaps().
+        :param chunk_size: The number of years per chunk
+        :param fill_value: If not None, nulls in the output are replaced with this value
+        :return: A generator of pgy data frames
+        """
+        years = np.arange(self._obj.year_id.min(), self._obj.year_id.max() + 1)
+        for extent in PgAccessor._iter_fill_product(self._obj, 'year_id', years, 'pg_id',
+                                                    self._obj.pg_id.unique(), chunk_size, fill_value=fill_value):
+            if 'pgy_id' in self._obj:
+                extent = PGYAccessor.__db_id(extent).set_axis(extent.index)
+            yield extent
+
     def fill_spatial_gaps(self, fill_value=None):
-        extent1 = pd.DataFrame({'pg_id': self._obj.pg_id.unique(), 'key': 0})
-        extent2 = pd.DataFrame({'key': 0, 'year_id': self._obj.year_id.unique()})
-        extent = extent1.merge(extent2, on='key')[['pg_id','year_id']]
-        extent = extent.merge(self._obj, how='left', on=['pg_id','year_id'])
+        extent = PgAccessor._fill_product(self._obj, 'pg_id', self._obj.pg_id.unique(),
+                                          'year_id', self._obj.year_id.unique(), fill_value=fill_value)
         if 'pgy_id' in self._obj:
             extent = PGYAccessor.__db_id(extent)
-        if fill_value is not None:
-            extent = extent.fillna(fill_value)
         return extent
 
     def fill_bbox(self, fill_value=None):
-        extent1 = pd.DataFrame({'pg_id': list(self.get_bbox()), 'key': 0})
-        extent2 = pd.DataFrame({'key': 0, 'year_id': list(self._obj.year_id.unique())})
-        extent3 = extent1.merge(extent2, on='key')[['pg_id','year_id']]
-        extent = extent3.merge(self._obj, how='left', on=['pg_id','year_id'])
+        extent = PgAccessor._fill_product(self._obj, 'pg_id', self._bbox(),
+                                          'year_id', self._obj.year_id.unique(), fill_value=fill_value)
         if 'pgy_id' in self._obj:
             extent = PGYAccessor.__db_id(extent)
-        if fill_value is not None:
-            extent = extent.fillna(fill_value)
         return extent
 
     @staticmethod
-    def __db_id(z):
-        db_ids = fetch_ids_df('priogrid_year')[['id', 'priogrid_gid', 'year_id']]
-        z = z.copy().reset_index(drop=True)
-        try:
-            del z['id']
-        except:
-            pass
-        z = z.copy().reset_index(drop=True)
-        z['pgy_id'] = z.merge(db_ids, left_on=['pg_id', 'year_id'],
-                              right_on=['priogrid_gid', 'year_id'],
-                              how='left').id
-        return z
+    def __db_id(df, trim=False):
+        """
+        Attaches the pgy_id of each row, using the priogrid_year id matrix.
+        :param df: A pgy data frame
+        :param trim: If True, drop the rows that have no pgy_id instead of leaving them NaN
+        :return: A copy of df, with a fresh RangeIndex (before trimming) and a pgy_id column
+        """
+        z = df.reset_index(drop=True).drop(columns='id', errors='ignore')
+        ids, valid = lookup_ids('priogrid_year', z.pg_id, z.year_id)
+        if trim:
+            return z.assign(pgy_id=ids)[valid]
+        return z.assign(pgy_id=ids if valid.all() else np.where(valid, ids, np.nan))
 
     @property
     def c_id(self):
-        return self._obj.apply(lambda row: Country.from_priogrid(row.pg_id, row.year_id).id, axis=1)
+        """
+        Returns the country corresponding to each priogrid in the year of the row
+        :return: A column of ViEWS country IDs, 0 for terra nullius
+        """
+        return pd.Series(Country.priogrids2ids(self._obj.pg_id, self._obj.year_id), index=self._obj.index)
 
     def db_id(self):
         return PGYAccessor.__db_id(self._obj)
 
     def trim_to_db_extent(self):
-        try:
-            del self._obj.pgy_id
-        except AttributeError:
-            pass
-        z = self.db_id()
-        z = z[z.pgy_id.notna()]
-        z['pgy_id'] = z.pgy_id.astype('int64')
-        return z
+        return PGYAccessor.__db_id(self._obj, trim=True)
 
 
 @pd.api.extensions.register_dataframe_accessor("fuzzy_country")
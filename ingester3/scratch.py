@@ -1,9 +1,23 @@
+import os
+import sys
+import shutil
+import threading
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from tempfile import SpooledTemporaryFile
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 import warnings
+import numpy as np
 import pandas as pd
 from diskcache import Cache
 from .config import source_db_path, working_dir
-from .config import source_cache_path, secondary_cache_path
+from .config import source_cache_path, secondary_cache_path, id_matrix_path, ids_store_path, cache_check_ttl
 
 cache = Cache(source_cache_path, size_limit=int(10e9))
 secondary_cache = Cache(secondary_cache_path, size_limit=int(10e9))
@@ -14,22 +28,24 @@ views_engine = sa.create_engine(source_db_path, pool_recycle=3600, execution_opt
 meta = sa.MetaData(schema='prod', bind=views_engine)
 
 
-def fetch_db_timestamp(stamp_level = 'ddl_stamp'):
-    "stamp_level has to be one of the stamping levels"
+def fetch_db_timestamps():
+    """
+    Reads all the DB update stamps in a single query, without reflecting the stamp table.
+    :return: A dict of stamp_level -> stamp, all 0 if the DB cannot be reached.
+    """
+    query = sa.text("SELECT * FROM prod_metadata.update_stamp")
     try:
-        timestamp_table = sa.Table('update_stamp',
-                                   sa.MetaData(),
-                                   schema='prod_metadata',
-                                   autoload=True,
-                                   autoload_with=views_engine)
-        query = sa.select([timestamp_table.c[stamp_level]])
         with views_engine.connect() as conn:
-            db_stamp = conn.execute(query).fetchone()[0]
-            ##print(db_stamp)
+            result = conn.execute(query)
+            return dict(zip(result.keys(), result.fetchone()))
     except sa.exc.OperationalError:
-        db_stamp = 0
         warnings.warn("No database connection! Will try to use cache for read-only ops as much as I can")
-    return db_stamp
+        return {'ddl_stamp': 0, 'data_stamp': 0, 'ddlm_stamp': 0, 'id_colset_stamp': 0}
+
+
+def fetch_db_timestamp(stamp_level = 'ddl_stamp'):
+    "stamp_level has to be one of the stamping levels"
+    return fetch_db_timestamps()[stamp_level]
 
 
 def fetch_local_timestamp(stamp_level='ddl_stamp'):
@@ -45,10 +61,110 @@ def write_local_timestamp(db_stamp, stamp_level = 'ddl_stamp'):
     with open(f'{working_dir}/{stamp_level}.cache', mode='w') as f: f.write(str(db_stamp))
 
 
-def cache_manager(clear=False, secondary_clear=False):
+__cache_check = {'last': None, 'pinned': False, 'ddlm_stamp': None}
+__memory_tier = []
+
+
+def memory_tier(maxsize=256, max_bytes=None, sizeof=None):
+    """
+    Decorator putting a bounded in-process LRU cache in front of a (diskcache memoized) metadata fetcher,
+    so repeated calls skip the SQLite lookup and the unpickling. Cleared together with the primary cache.
+    Results are shared between callers and must not be mutated.
+    :param maxsize: The maximum number of results kept in memory
+    :param max_bytes: Optionally, the maximum total size of the results kept in memory.
+    Results larger than this are never kept.
+    :param sizeof: The size in bytes of a result, used with max_bytes. sys.getsizeof by default.
+    """
+    def decorator(func):
+        if max_bytes is None:
+            cached = lru_cache(maxsize=maxsize)(func)
+        else:
+            cached = __bytes_bounded_lru(func, maxsize, max_bytes, sys.getsizeof if sizeof is None else sizeof)
+        __memory_tier.append(cached.cache_clear)
+        return cached
+    return decorator
+
+
+def __bytes_bounded_lru(func, maxsize, max_bytes, sizeof):
+    """
+    An lru_cache bounded by both the number and the total size of the results, see memory_tier.
+    """
+    entries = OrderedDict()
+    used = [0]
+    lock = threading.Lock()
+
+    @wraps(func)
+    def cached(*args, **kwargs):
+        key = args + tuple(sorted(kwargs.items()))
+        with lock:
+            if key in entries:
+                entries.move_to_end(key)
+                return entries[key][0]
+        result = func(*args, **kwargs)
+        size = sizeof(result)
+        if size > max_bytes:
+            return result
+        with lock:
+            if key in entries:
+                used[0] -= entries.pop(key)[1]
+            entries[key] = (result, size)
+            used[0] += size
+            while len(entries) > maxsize or used[0] > max_bytes:
+                used[0] -= entries.popitem(last=False)[1][1]
+        return result
+
+    def cache_clear():
+        with lock:
+            entries.clear()
+            used[0] = 0
+
+    cached.cache_clear = cache_clear
+    cached.cache_info = lambda: {'entries': len(entries), 'bytes': used[0]}
+    return cached
+
+
+def register_memory_tier(clear):
+    """
+    Registers another in-process cache derived from the DB, so it is emptied together with the memory tier.
+    :param clear: A callable taking no arguments, emptying the cache
+    :return: Nothing
+    """
+    __memory_tier.append(clear)
+
+
+def clear_memory_tier():
+    """
+    Empties the in-process metadata caches (see memory_tier).
+    :return: Nothing
+    """
+    for clear in __memory_tier:
+        clear()
+
+
+def pin_snapshot():
+    """
+    Pins the caches to their current state: cache_manager stops checking the DB for changes
+    (unless forced or asked to clear) until unpin_snapshot is called.
+    Useful for long loops and batch jobs that read, but do not write to, the DB.
+    :return: Nothing
+    """
+    __cache_check['pinned'] = True
+
+
+def unpin_snapshot():
+    """
+    Undoes pin_snapshot. The next cache_manager call checks the DB again.
+    :return: Nothing
+    """
+    __cache_check['pinned'] = False
+    __cache_check['last'] = None
+
+
+def cache_manager(clear=False, secondary_clear=False, force=False):
     """
     :param clear: bool, force the primary cache to be destroyed and renewed.
     :param secondary_clear: bool, force the secondary cache to be destroyed
+    :param force: bool, check the DB timestamps even if the last check is recent or the snapshot is pinned.
     :return: Nothing
 
     There are two db caches:
@@ -60,17 +176,32 @@ def cache_manager(clear=False, secondary_clear=False):
 
     The primary cache relies on triggers from the DB, that generate a series of timestamps, that are stored both here
     and on the DB. If the timestamp here does not match the DB timestamp the cache is autoflushed.
+
+    Checking the timestamps costs a DB round-trip, so it is done at most once every cache_check_ttl seconds
+    (INGESTER_CACHE_TTL, 60 by default) per process, and not at all while the snapshot is pinned (see pin_snapshot).
     """
     """If the database timestamp is different from the local timestamp,
         flush the cache, and store a new cache timestamp cookie"""
 
+    if not (clear or secondary_clear or force):
+        if __cache_check['pinned']:
+            return
+        if __cache_check['last'] is not None and time.monotonic() - __cache_check['last'] < cache_check_ttl:
+            return
+
+    db_stamps = fetch_db_timestamps()
+    if clear or db_stamps['ddlm_stamp'] != __cache_check['ddlm_stamp']:
+        # Another process may already have renewed the disk cache, so the memory tier follows the DB stamp.
+        clear_memory_tier()
+        __cache_check['ddlm_stamp'] = db_stamps['ddlm_stamp']
+
     if clear:
-        db_stamp = fetch_db_timestamp('ddlm_stamp')
+        db_stamp = db_stamps['ddlm_stamp']
         print("Clearing Cache")
         cache.clear(retry=True)
         write_local_timestamp(db_stamp, 'ddlm_stamp')
     else:
-        db_stamp = fetch_db_timestamp('ddlm_stamp')
+        db_stamp = db_stamps['ddlm_stamp']
         local_stamp = fetch_local_timestamp('ddlm_stamp')
         if local_stamp+db_stamp == 0:
             raise ConnectionError("Cannot connect to the DB and you have NO working cache!")
@@ -82,42 +213,161 @@ def cache_manager(clear=False, secondary_clear=False):
     if secondary_clear:
         print("Clearing Secondary Cache...")
         secondary_cache.clear(retry=True)
-        db_secondary = fetch_db_timestamp('id_colset_stamp')
+        clear_ids_store()
+        clear_id_matrices()
+        db_secondary = db_stamps['id_colset_stamp']
         write_local_timestamp(db_secondary, 'id_colset_stamp')
     else:
-        db_secondary = fetch_db_timestamp('id_colset_stamp')
+        db_secondary = db_stamps['id_colset_stamp']
         local_secondary = fetch_local_timestamp('id_colset_stamp')
         #print(f"SECONDARY : {db_secondary},{local_secondary}")
         if local_secondary < db_secondary:
             print("Clearing Secondary Cache...")
             secondary_cache.clear(retry=True)
+            clear_ids_store()
+            clear_id_matrices()
             write_local_timestamp(db_secondary, 'id_colset_stamp')
 
+    __cache_check['last'] = time.monotonic()
+
+SNAPSHOT_SCHEMAS = ('prod', 'prod_metadata')
+
+# Postgres information_schema data types, as reflection would type them.
+__snapshot_types = {'integer': postgresql.INTEGER, 'bigint': postgresql.BIGINT, 'smallint': postgresql.SMALLINT,
+                    'double precision': postgresql.DOUBLE_PRECISION, 'real': postgresql.REAL,
+                    'numeric': postgresql.NUMERIC, 'text': postgresql.TEXT, 'character varying': postgresql.VARCHAR,
+                    'character': postgresql.CHAR, 'boolean': postgresql.BOOLEAN, 'date': postgresql.DATE,
+                    'timestamp without time zone': postgresql.TIMESTAMP,
+                    'timestamp with time zone': lambda: postgresql.TIMESTAMP(timezone=True),
+                    'time without time zone': postgresql.TIME,
+                    'time with time zone': lambda: postgresql.TIME(timezone=True),
+                    'interval': postgresql.INTERVAL, 'json': postgresql.JSON, 'jsonb': postgresql.JSONB,
+                    'uuid': postgresql.UUID, 'bytea': postgresql.BYTEA}
+
+__snapshot_query = sa.text("""
+SELECT
+  (SELECT ddlm_stamp FROM prod_metadata.update_stamp LIMIT 1) AS version,
+  (SELECT json_agg(json_build_array(table_schema, table_name, column_name, data_type)
+                   ORDER BY table_schema, table_name, ordinal_position)
+     FROM information_schema.columns WHERE table_schema IN ('prod', 'prod_metadata')) AS columns,
+  (SELECT json_agg(json_build_array(n.nspname, t.relname, a.attname))
+     FROM pg_index i
+     JOIN pg_class t ON t.oid = i.indrelid
+     JOIN pg_namespace n ON n.oid = t.relnamespace
+     JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(i.indkey)
+     WHERE i.indisprimary AND n.nspname IN ('prod', 'prod_metadata')) AS primary_keys,
+  (SELECT json_agg(json_build_array(n.nspname, t.relname, a.attname, rn.nspname, rt.relname, ra.attname))
+     FROM pg_constraint c
+     JOIN pg_class t ON t.oid = c.conrelid
+     JOIN pg_namespace n ON n.oid = t.relnamespace
+     JOIN pg_class rt ON rt.oid = c.confrelid
+     JOIN pg_namespace rn ON rn.oid = rt.relnamespace
+     CROSS JOIN LATERAL unnest(c.conkey, c.confkey) AS k(attnum, fattnum)
+     JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+     JOIN pg_attribute ra ON ra.attrelid = rt.oid AND ra.attnum = k.fattnum
+     WHERE c.contype = 'f' AND n.nspname IN ('prod', 'prod_metadata')) AS foreign_keys,
+  (SELECT json_agg(to_json(l)) FROM prod_metadata.leaf_tables l) AS leaf_tables
+""")
+
+
+@dataclass(frozen=True)
+class SchemaSnapshot:
+    """
+    The reflected prod and prod_metadata schemas, as of the ddlm_stamp in version.
+    tables are keyed like sa.MetaData.tables, i.e. 'prod.country'.
+    leaf_tables are the rows of prod_metadata.leaf_tables, as tuples.
+    """
+    version: int
+    metadata: sa.MetaData
+    leaf_tables: tuple
+
+    def table(self, table, schema='prod'):
+        try:
+            return self.metadata.tables[f'{schema}.{table}']
+        except KeyError:
+            raise sa.exc.NoSuchTableError(f'{schema}.{table}')
+
+
+@cache.memoize(typed=True, expire=None, tag='fetch_schema')
+def __fetch_catalog():
+    """
+    The rows of the catalog query behind fetch_schema, cached on disk like the other schema lookups.
+    The tables with column types the query cannot map are reflected here, each into a MetaData of its own,
+    so that the cache entry only holds those tables and not the whole schema.
+    :return: A tuple (version, columns, primary_keys, foreign_keys, leaf_tables, reflected_tables)
+    """
+    with views_engine.connect() as conn:
+        version, columns, primary_keys, foreign_keys, leaf_tables = conn.execute(__snapshot_query).fetchone()
+        columns = columns or []
+        reflected = set((schema, table) for schema, table, _, data_type in columns
+                        if data_type not in __snapshot_types)
+        reflected_tables = []
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=sa.exc.SAWarning)
+            for schema, table in sorted(reflected):
+                # The referenced tables are in the snapshot, so they are not reflected along.
+                reflected_tables += [sa.Table(table, sa.MetaData(), schema=schema, autoload_with=conn,
+                                              resolve_fks=False)]
+    return version, columns, primary_keys or [], foreign_keys or [], leaf_tables or [], reflected_tables
+
+
+@memory_tier(maxsize=1)
+def fetch_schema():
+    """
+    Reflects the prod and prod_metadata schemas (columns, types, primary and foreign keys) and the leaf table
+    registry in a single catalog query, instead of one autoload per table.
+    Tables with column types the catalog query cannot map (e.g. arrays, PostGIS or other user-defined types)
+    are reflected the usual way, so that their types match what reflection gives.
+    The catalog is cached on disk, so a new process builds the snapshot without a DB round-trip,
+    and the snapshot is kept in memory. Both are renewed whenever the DDL stamp changes.
+    :return: A SchemaSnapshot
+    """
+    version, columns, primary_keys, foreign_keys, leaf_tables, reflected_tables = __fetch_catalog()
+    primary_keys = set(tuple(i) for i in primary_keys)
+    references = {}
+    for schema, table, column, ref_schema, ref_table, ref_column in foreign_keys:
+        references.setdefault((schema, table, column), []).append(f'{ref_schema}.{ref_table}.{ref_column}')
+
+    metadata = sa.MetaData()
+    reflected = set((table.schema, table.name) for table in reflected_tables)
+    tables = {}
+    for schema, table, column, data_type in columns:
+        if (schema, table) in reflected:
+            continue
+        if (schema, table) not in tables:
+            tables[schema, table] = sa.Table(table, metadata, schema=schema)
+        tables[schema, table].append_column(
+            sa.Column(column, __snapshot_types[data_type](),
+                      *[sa.ForeignKey(ref) for ref in references.get((schema, table, column), [])],
+                      primary_key=(schema, table, column) in primary_keys))
+    for table in reflected_tables:
+        table.to_metadata(metadata)
+    leaf_tables = tuple(tuple(row.values()) for row in leaf_tables)
+    return SchemaSnapshot(version=version, metadata=metadata, leaf_tables=leaf_tables)
+
+
+@memory_tier()
 @cache.memoize(typed=True, expire=None, tag='fetch_children')
 def fetch_children(loa_table, views_engine = views_engine):
-    views_leafs = sa.Table('leaf_tables',
-                           sa.MetaData(),
-                           schema='prod_metadata',
-                           autoload=True,
-                           autoload_with=views_engine)
-    query = sa.select([views_leafs]).where(views_leafs.c.root_table == loa_table)
-    with views_engine.connect() as conn:
-        data = conn.execute(query)
-        results = data.fetchall()
-        data = [{'table': row[1], 'id': row[2], 'parent': row[3]} for row in results]
-        id_name = 'id'
-        data += [{'table': loa_table, 'id': id_name, 'parent': None}]
-        return data
+    leaf_tables = sa.inspect(fetch_schema().table('leaf_tables', schema='prod_metadata'))
+    root = [column.name for column in leaf_tables.c].index('root_table')
+    results = [row for row in fetch_schema().leaf_tables if row[root] == loa_table]
+    data = [{'table': row[1], 'id': row[2], 'parent': row[3]} for row in results]
+    id_name = 'id'
+    data += [{'table': loa_table, 'id': id_name, 'parent': None}]
+    return data
 
 
 def flash_fetch_definitions(schema,table):
     mapper = []
-    conn = views_engine.connect()
-    new_table = sa.Table(table,
-                         sa.MetaData(),
-                         schema=schema,
-                         autoload=True,
-                         autoload_with=views_engine)
+    if schema in SNAPSHOT_SCHEMAS:
+        new_table = fetch_schema().table(table, schema=schema)
+    else:
+        new_table = sa.Table(table,
+                             sa.MetaData(),
+                             schema=schema,
+                             autoload=True,
+                             autoload_with=views_engine)
     inspector = sa.inspect(new_table)
     #print(">",inspector)
     for column in inspector.c:
@@ -129,24 +379,34 @@ def flash_fetch_definitions(schema,table):
         mapper += [{'column_name': column.name,
                     'sa_column': column,
                     'type': col_type}]
-    conn.close()
     return mapper
 
 
-@cache.memoize(typed=True, expire=None, tag='fetch_columns')
+@memory_tier()
 def fetch_columns(loa_table, data_summarization=False):
+    """
+    The columns of a loa table and its leaf tables, as dicts with the table, column_name, sa_column, type,
+    pkey and (with data_summarization) min_value, max_value and mean_value of each column.
+    """
+    schema = fetch_schema()
+    return [dict(column, sa_column=schema.table(column['table']).c[column['column_name']])
+            for column in __fetch_column_definitions(loa_table, data_summarization)]
+
+
+@cache.memoize(typed=True, expire=None, tag='fetch_columns')
+def __fetch_column_definitions(loa_table, data_summarization=False):
+    """
+    fetch_columns without the sa_column, which is resolved against the in-process schema snapshot on read.
+    A pickled Column drags its whole MetaData, i.e. the entire schema, into every cache entry.
+    """
     tables = fetch_children(loa_table)
-    conn = views_engine.connect()
+    conn = views_engine.connect() if data_summarization else None
     mapper = []
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=sa.exc.SAWarning)
         for table in tables:
             #print(table['table'])
-            views_tables = sa.Table(table['table'],
-                                    sa.MetaData(),
-                                    schema='prod',
-                                    autoload=True,
-                                    autoload_with=views_engine)
+            views_tables = fetch_schema().table(table['table'])
             inspector = sa.inspect(views_tables)
             for column in inspector.c:
                 if data_summarization:
@@ -171,31 +431,59 @@ def fetch_columns(loa_table, data_summarization=False):
                     col_type = None
                 mapper += [{'table': table['table'],
                             'column_name': column.name,
-                            'sa_column': column,
                             'type': col_type,
                             'pkey': column.primary_key,
                             'min_value': min_value,
                             'max_value': max_value,
                             'mean_value': mean_value}]
-        conn.close()
+        if conn is not None:
+            conn.close()
     return mapper
 
-@cache.memoize(typed=True, expire=None, tag='fetch_keys')
+@memory_tier()
 def fetch_keys(loa_table):
+    """
+    :return: A tuple (primary_keys, foreign_keys) of lists of the sa.Column objects of loa_table
+    """
+    primary_keys, foreign_keys = __fetch_key_names(loa_table)
+    views_tables = fetch_schema().table(loa_table)
+    return [views_tables.c[name] for name in primary_keys], [views_tables.c[name] for name in foreign_keys]
+
+
+@cache.memoize(typed=True, expire=None, tag='fetch_keys')
+def __fetch_key_names(loa_table):
+    """
+    fetch_keys by column name, so that the cached result does not pickle the schema, see __fetch_column_definitions.
+    """
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=sa.exc.SAWarning)
-        views_tables = sa.Table(loa_table,
-                                    sa.MetaData(),
-                                    schema='prod',
-                                    autoload=True,
-                                    autoload_with=views_engine)
+        views_tables = fetch_schema().table(loa_table)
         inspector = sa.inspect(views_tables)
         #list_fk = list(inspector.foreign_key_constraints)
-        primary_keys = [col for col in inspector.c if col.primary_key]
-        foreign_keys = [col for col in inspector.c if len(col.foreign_keys) > 0]
+        primary_keys = [col.name for col in inspector.c if col.primary_key]
+        foreign_keys = [col.name for col in inspector.c if len(col.foreign_keys) > 0]
         return primary_keys, foreign_keys
 
 
+def __ids_nbytes(ids):
+    """
+    Estimates the in-memory size of a fetch_ids result, a list of keys and a list of foreign key rows,
+    from the size of their first elements.
+    """
+    size = 0
+    for values in ids:
+        size += sys.getsizeof(values)
+        if len(values) > 0:
+            first = values[0]
+            # Foreign key rows are SQLAlchemy Rows, i.e. sequences of keys
+            items = first if isinstance(first, Sequence) and not isinstance(first, str) else ()
+            size += len(values) * (sys.getsizeof(first) + sum(sys.getsizeof(item) for item in items))
+    return size
+
+
+# The ids of the dense loa tables (e.g. priogrid_month) run into the GBs as Python objects, so they are only kept
+# in memory if they fit, see fetch_ids_df for a compact alternative.
+@memory_tier(max_bytes=256 * 2 ** 20, sizeof=__ids_nbytes)
 @cache.memoize(typed=True, expire=None, tag="fetch_id")
 def fetch_ids(loa_table):
     primary_keys, foreign_keys = fetch_keys(loa_table)
@@ -213,30 +501,277 @@ def fetch_ids(loa_table):
             return pk_data, fk_data
 
 
-@secondary_cache.memoize(typed=True, expire=None, tag="fetch_ids_df")
-def fetch_ids_df(loa_table):
+def clear_ids_store():
+    """
+    Drops the columnar store of the fetch_ids_df structures.
+    :return: Nothing
+    """
+    shutil.rmtree(ids_store_path, ignore_errors=True)
+
+
+def __write_ids_store(loa_table, df):
+    """
+    Persists an id structure as one .npy file per column, plus a list of columns.
+    Numeric and datetime columns can then be memory mapped, object columns are pickled.
+    The table is written to a temporary directory of its own, that is renamed in place when complete.
+    """
+    path = os.path.join(ids_store_path, loa_table)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for i, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        np.save(os.path.join(tmp_path, f'{i}.npy'), values, allow_pickle=values.dtype.hasobject)
+    np.save(os.path.join(tmp_path, 'columns.npy'), np.array(df.columns, dtype=str))
+    try:
+        # Renaming onto an existing (non-empty) store fails, so on a parallel cold start the first writer wins
+        # and a store is never replaced under a reader.
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def __read_ids_store(loa_table):
+    """
+    Opens an id structure from the columnar store, memory mapped, so no data is read until it is used
+    and the pages are shared by all the processes on the machine.
+    :return: A DataFrame, or None if the table is not in the store (or the store was cleared while reading)
+    """
+    path = os.path.join(ids_store_path, loa_table)
+    data = {}
+    try:
+        columns = np.load(os.path.join(path, 'columns.npy')).tolist()
+        for i, column in enumerate(columns):
+            try:
+                data[column] = np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r').view(np.ndarray)
+            except ValueError:
+                # Object columns cannot be memory mapped.
+                data[column] = np.load(os.path.join(path, f'{i}.npy'), allow_pickle=True)
+    except FileNotFoundError:
+        return None
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def __mapped_ids_df(loa_table, workers=1, progress=None, use_copy=False):
+    """
+    fetch_ids_df without the copy: the columns are read-only views on the memory mapped store.
+    Only for internal, read-only uses such as building the id matrices.
+    """
+    result = __read_ids_store(loa_table)
+    if result is None:
+        ids = __query_ids_df(loa_table, workers=workers, progress=progress, use_copy=use_copy)
+        __write_ids_store(loa_table, ids)
+        result = __read_ids_store(loa_table)
+        if result is None:
+            # The store was cleared in the meantime.
+            result = ids
+    return result
+
+
+def fetch_ids_df(loa_table, workers=1, progress=None, use_copy=False):
+    """
+    Fetches the id structure of a loa table (its primary and foreign keys), e.g. priogrid_month.
+    This is only queried once, after which it is stored column-wise on disk and memory mapped on read.
+    The store is dropped when the secondary cache is cleared.
+    :param loa_table: A loa table, e.g. country_month
+    :param workers: Number of connections reading disjoint primary key ranges in parallel on the first fetch
+    :param progress: Optional callable progress(rows_read, rows_total), called once before reading (with 0 rows)
+    and after every chunk on the first fetch
+    :param use_copy: Read through COPY TO STDOUT instead of pd.read_sql, much faster for large tables
+    :return: A DataFrame of ids, owning its (writable) data
+    """
+    return __mapped_ids_df(loa_table, workers=workers, progress=progress, use_copy=use_copy).copy(deep=True)
+
+
+COPY_NULL = '\\N'
+
+
+def read_sql_copy(query, parse_dates=None, dtype=None):
+    """
+    Reads the result of a query through COPY (...) TO STDOUT, the server's bulk export path.
+    This skips building a Python row object per row, which is what makes pd.read_sql slow on multi-million row results.
+    The CSV stream is spooled in memory (to disk past 64 MB) and parsed straight into typed columns by pandas.
+    NULLs are exported as COPY_NULL, the only value read back as missing, so text such as 'NA' or '' is kept as is
+    (text that is exactly COPY_NULL cannot be told from a NULL).
+    :param query: A SQLAlchemy selectable (bound parameters are inlined) or a text/str query
+    :param parse_dates: Optional list of columns to parse as datetimes
+    :param dtype: Optional dtype or {column: dtype} passed to read_csv, e.g. str for text columns,
+    which would otherwise be type inferred (and lose leading zeros)
+    :return: A DataFrame
+    """
+    if not isinstance(query, str):
+        query = str(query.compile(dialect=views_engine.dialect, compile_kwargs={'literal_binds': True}))
+    raw_con = views_engine.raw_connection()
+    try:
+        cur = raw_con.cursor()
+        with SpooledTemporaryFile(max_size=64 * 2 ** 20) as buffer:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '{COPY_NULL}')", buffer)
+            cur.close()
+            buffer.seek(0)
+            return pd.read_csv(buffer, parse_dates=parse_dates, dtype=dtype, keep_default_na=False,
+                               na_values=[COPY_NULL], true_values=['t'], false_values=['f'])
+    finally:
+        raw_con.close()
+
+
+def __read_key_range(keys, lower, upper, on_chunk, use_copy=False):
+    """
+    Reads the keys of the rows with lower <= primary key < upper (None meaning unbounded),
+    on its own pooled connection, in chunks of 50000 rows, or in one COPY if use_copy.
+    :return: A list of DataFrame chunks, in primary key order
+    """
+    pk = keys[0]
+    query = sa.select(keys).order_by(pk)
+    if lower is not None:
+        query = query.where(pk >= lower)
+    if upper is not None:
+        query = query.where(pk < upper)
+    if use_copy:
+        chunk = read_sql_copy(query)
+        on_chunk(chunk.shape[0])
+        return [chunk]
+    chunks = []
+    with views_engine.connect() as conn:
+        for chunk in pd.read_sql(query, con=conn, chunksize=50000):
+            chunks += [chunk]
+            on_chunk(chunk.shape[0])
+    return chunks
+
+
+def __query_ids_df(loa_table, workers=1, progress=None, use_copy=False):
     primary_keys, foreign_keys = fetch_keys(loa_table)
-    print(f"Instantiating {loa_table}, please wait...")
-    if loa_table =='priogrid_month':
-        print(f"PGM table can take up to 20 minutes, but will not be repeated...")
     keys = primary_keys+foreign_keys
-    query_keys = sa.select(keys)
-    i = 0
-    result = pd.DataFrame()
-    with views_engine.connect() as conn:
-        for table in pd.read_sql(query_keys, con=conn, chunksize=50000):
-            i += 1
-            print (f"Fetching rows : {(i-1)*50000} - {i*50000}")
-            result = pd.concat([result,table], ignore_index=True)
-    return result
+    total = fetch_counts(loa_table)
+    if progress is not None:
+        progress(0, total)
+
+    ranges = [(None, None)]
+    if workers > 1 and total > 50000:
+        with views_engine.connect() as conn:
+            lowest, highest = conn.execute(sa.select([sa.func.min(keys[0]), sa.func.max(keys[0])])).fetchone()
+        bounds = np.linspace(lowest, highest + 1, workers + 1).astype('int64').tolist()
+        ranges = list(zip([None] + bounds[1:-1], bounds[1:-1] + [None]))
+
+    lock = threading.Lock()
+    read = [0]
+
+    def on_chunk(rows):
+        with lock:
+            read[0] += rows
+            if progress is not None:
+                progress(read[0], total)
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        parts = list(executor.map(lambda bounds: __read_key_range(keys, *bounds, on_chunk, use_copy), ranges))
+    chunks = [chunk for part in parts for chunk in part]
+    if len(chunks) == 0:
+        return pd.DataFrame(columns=[key.name for key in keys])
+    return pd.concat(chunks, ignore_index=True)
+
+
+# The (space, time) foreign keys that identify each row of the dense loa tables.
+ID_MATRIX_KEYS = {'priogrid_month': ('priogrid_gid', 'month_id'),
+                  'priogrid_year': ('priogrid_gid', 'year_id')}
+__id_matrices = {}
+
+
+def clear_id_matrices():
+    """
+    Drops the id matrices, both the loaded ones and the ones persisted in the working dir.
+    Called whenever the secondary cache is cleared, since they are built from the same id structures.
+    :return: Nothing
+    """
+    __id_matrices.clear()
+    shutil.rmtree(id_matrix_path, ignore_errors=True)
+
+
+def __build_id_matrix(loa_table, workers=1, progress=None, use_copy=False):
+    space_col, time_col = ID_MATRIX_KEYS[loa_table]
+    ids = __mapped_ids_df(loa_table, workers=workers, progress=progress, use_copy=use_copy)
+    space_ids = ids[space_col].to_numpy(dtype='int64')
+    time_ids = ids[time_col].to_numpy(dtype='int64')
+    cells = pd.unique(space_ids)
+    cells.sort()
+    space_index = np.full(259201, -1, dtype='int32')
+    space_index[cells] = np.arange(cells.shape[0], dtype='int32')
+    first_time = time_ids.min()
+    matrix = np.full((time_ids.max() - first_time + 1, cells.shape[0]), -1, dtype='int32')
+    matrix[time_ids - first_time, space_index[space_ids]] = ids['id'].to_numpy(dtype='int32')
+
+    os.makedirs(id_matrix_path, exist_ok=True)
+    # The matrix is written last, and each file is moved in place atomically, so it marks a complete set.
+    # Concurrent builders write identical files, each through its own temporary file.
+    for suffix, array in (('space', space_index), ('time', np.array([first_time])), ('ids', matrix)):
+        path = os.path.join(id_matrix_path, f'{loa_table}.{suffix}.npy')
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+
+def fetch_id_matrix(loa_table, workers=1, progress=None, use_copy=False):
+    """
+    A dense, memory mapped lookup of the ids of a (space, time) loa table, i.e. priogrid_month and priogrid_year.
+    Built from fetch_ids_df on first use and persisted in the working dir, so it is only built once.
+    :param loa_table: One of the tables in ID_MATRIX_KEYS
+    :param workers: Passed to fetch_ids_df when the matrix is built
+    :param progress: Passed to fetch_ids_df when the matrix is built
+    :param use_copy: Passed to fetch_ids_df when the matrix is built
+    :return: A tuple (space_index, first_time, matrix). The id of (pg_id, time_id) is
+    matrix[time_id - first_time, space_index[pg_id]], -1 in either the index or the matrix meaning no such row.
+    """
+    if loa_table not in ID_MATRIX_KEYS:
+        raise KeyError(f"No id matrix is available for {loa_table}")
+    if loa_table not in __id_matrices:
+        path = os.path.join(id_matrix_path, loa_table)
+        if not os.path.exists(f'{path}.ids.npy'):
+            __build_id_matrix(loa_table, workers=workers, progress=progress, use_copy=use_copy)
+        __id_matrices[loa_table] = (np.load(f'{path}.space.npy', mmap_mode='r'),
+                                    int(np.load(f'{path}.time.npy')[0]),
+                                    np.load(f'{path}.ids.npy', mmap_mode='r'))
+    return __id_matrices[loa_table]
+
+
+def __null_safe_keys(values):
+    """
+    :return: A tuple (keys, known) of an int64 array and a mask of the non-null values. Null keys are 0.
+    """
+    values = pd.Series(values, copy=False)
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'iu':
+        return values.to_numpy(dtype='int64'), np.ones(values.shape[0], dtype=bool)
+    known = values.notna().to_numpy()
+    keys = values.to_numpy(dtype='float64', na_value=np.nan)
+    return np.where(known, keys, 0).astype('int64'), known
+
+
+def lookup_ids(loa_table, space_ids, time_ids, workers=1, progress=None, use_copy=False):
+    """
+    Vectorized (pg_id, time_id) -> db id lookup in the id matrix of loa_table, without loading the id table.
+    :param loa_table: One of the tables in ID_MATRIX_KEYS
+    :param space_ids: An array-like of priogrid ids
+    :param time_ids: An array-like of month or year ids, aligned with space_ids
+    :param workers: Passed to fetch_ids_df if the id matrix has to be built
+    :param progress: Passed to fetch_ids_df if the id matrix has to be built
+    :param use_copy: Passed to fetch_ids_df if the id matrix has to be built
+    :return: A tuple (ids, valid) of numpy arrays. ids are 0 wherever valid is False, i.e. the row is not in the DB
+    or one of its keys is null.
+    """
+    space_index, first_time, matrix = fetch_id_matrix(loa_table, workers=workers, progress=progress, use_copy=use_copy)
+    space_ids, space_known = __null_safe_keys(space_ids)
+    time_ids, time_known = __null_safe_keys(time_ids)
+    time_ids = time_ids - first_time
+    valid = space_known & time_known
+    valid &= (space_ids >= 0) & (space_ids < space_index.shape[0]) & (time_ids >= 0) & (time_ids < matrix.shape[0])
+    cols = np.where(valid, space_index[np.where(valid, space_ids, 0)], -1)
+    valid &= cols >= 0
+    ids = matrix[np.where(valid, time_ids, 0), np.where(valid, cols, 0)].astype('int64')
+    valid &= ids >= 0
+    ids[~valid] = 0
+    return ids, valid
+
 
 @cache.memoize(typed=True, expire=None, tag='counter_fetch')
 def fetch_counts(loa_table):
-    views_table = sa.Table(loa_table,
-                            sa.MetaData(),
-                            schema='prod',
-                            autoload=True,
-                            autoload_with=views_engine)
+    views_table = fetch_schema().table(loa_table)
     query = sa.select([sa.func.count(views_table.c.id)])
     with views_engine.connect() as conn:
         try:
@@ -246,7 +781,7 @@ def fetch_counts(loa_table):
         return data
 
 
-def fetch_data(loa_table, columns=None):
+def fetch_data(loa_table, columns=None, use_copy=False):
     if columns is None:
         return None
     columns = [columns] if isinstance(columns, str) else columns
@@ -288,6 +823,10 @@ def fetch_data(loa_table, columns=None):
     where_side = ' AND '.join(set(read_relations))
     text_query = f'SELECT {col_side} FROM {from_side}'
     text_query = text_query + 'WHERE {where_side}' if len(where_side)>0 else text_query
+    if use_copy:
+        dates = [i['column_name'] for i in db_subset if i['type'] in (datetime.datetime, datetime.date)]
+        texts = {i['column_name']: str for i in db_subset if i['type'] is str}
+        return read_sql_copy(text_query, parse_dates=dates, dtype=texts)
     text_query = sa.text(text_query)
     with views_engine.connect() as con:
         #data_out = con.execute(text_query).fetchall()
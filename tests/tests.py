@@ -240,3 +240,33 @@ assert c_pgm.loc[2].month_id == 503
 assert c_pgm.loc[3].month_id == 481
 
 assert c_pgm.pgm.full_set() == False
+
+# Countries are interned and immutable
+
+assert Country(85) is Country(85)
+assert Country(85) is Country(np.int64(85)) is Country.from_iso('ITA')
+assert Country(0) is Country(0) and Country(0).id is None
+for attribute, value in (('isoab', 'XXX'), ('id', 1), ('new_attribute', 1)):
+    try:
+        setattr(Country(85), attribute, value)
+        assert False
+    except AttributeError:
+        pass
+try:
+    del Country(85).name
+    assert False
+except AttributeError:
+    pass
+assert Country(85).isoab == 'ITA'
+
+# GW and ISO codes give the newest iteration of a country
+
+country_ids = fetch_ids('country')[0]
+all_countries = Country.lookup(country_ids, ['gwcode', 'isoab', 'month_end']).assign(c_id=country_ids)
+for code, resolve in (('gwcode', Country.from_gwcode), ('isoab', Country.from_iso)):
+    iterations = all_countries.dropna(subset=[code])
+    assert iterations[code].duplicated().any()
+    for value, month_end in iterations.groupby(code).month_end.max().items():
+        country = resolve(value)
+        assert country is Country(country.id)
+        assert getattr(country, code) == value and country.month_end == month_end
@@ -44,3 +44,418 @@ x2['year_id'] = [2007, 1988, 1992]
 
 assert (sum(x2.pgy.c_id == x1.expected) == 2)
 assert x2.pgy.c_id.loc[1] == 189
+
+x3 = x1.pg.geometry
+assert list(x3.columns) == ['row', 'col', 'lat', 'lon']
+assert x3.lat.loc[2] == Priogrid(157011).lat
+assert x3.col.loc[0] == Priogrid(173950).col
+
+x4 = pd.DataFrame({'lat': np.random.default_rng(1).uniform(-95, 95, 2000),
+                   'lon': np.random.default_rng(2).uniform(-185, 185, 2000)})
+x4.loc[:2, 'lat'] = [-90, 90, np.nan]
+x4.loc[:2, 'lon'] = [-180, 180, 0]
+ids, valid = Priogrid.latlon2id_array(x4.lat, x4.lon)
+for lat, lon, pg_id, is_valid in zip(x4.lat, x4.lon, ids, valid):
+    try:
+        expected = Priogrid.latlon2id(lat, lon)
+    except ValueError:
+        expected = None
+    assert (pg_id, is_valid) == ((expected, True) if expected is not None else (0, False))
+
+assert list(pd.DataFrame.pg.soft_validate_latlon(x4).valid_latlon) == list(valid)
+
+# CM/CY panel reports
+
+cm_countries = [c for c in [218, 117, 234, 57, 67] if Country(c).month_start <= 400 and Country(c).month_end >= 420]
+assert len(cm_countries) > 1
+cm1 = pd.DataFrame([(c, m) for c in cm_countries for m in range(400, 421)], columns=['c_id', 'month_id'])
+assert cm1.cm.is_panel()
+r1 = cm1.cm.panel_report()
+assert r1.is_panel.all()
+assert list(r1['size']) == [21] * len(cm_countries)
+cm2 = cm1[~((cm1.c_id == cm_countries[0]) & (cm1.month_id == 410))]
+assert not cm2.cm.is_panel()
+r2 = cm2.cm.panel_report()
+assert r2.gaps.loc[cm_countries[0]] and not r2.is_panel.loc[cm_countries[0]]
+assert r2.is_panel.drop(cm_countries[0]).all()
+cm3 = cm1[~((cm1.c_id == cm_countries[0]) & (cm1.month_id == 400))]
+assert cm3.cm.panel_report().late_start.loc[cm_countries[0]]
+assert not cm3.cm.is_panel()
+
+cy_countries = [c for c in [218, 117, 234, 57, 67] if Country(c).year_start <= 2000 and Country(c).year_end >= 2005]
+assert len(cy_countries) > 1
+cy1 = pd.DataFrame([(c, y) for c in cy_countries for y in range(2000, 2006)], columns=['c_id', 'year_id'])
+assert cy1.cy.is_panel()
+cy2 = cy1[~((cy1.c_id == cy_countries[0]) & (cy1.year_id == 2005))]
+assert cy2.cy.panel_report().early_end.loc[cy_countries[0]]
+assert not cy2.cy.is_panel()
+
+# PGM/PGY panel reports
+
+pgm1 = pd.DataFrame({'pg_id': np.tile([62356, 62357, 80317], 4), 'month_id': np.repeat([400, 401, 402, 403], 3)})
+assert pgm1.pgm.is_panel()
+assert list(pgm1.pgm.panel_report().cells) == [3, 3, 3, 3]
+pgm2 = pgm1[pgm1.month_id != 401]
+r3 = pgm2.pgm.panel_report()
+assert list(r3.index) == [400, 401, 402, 403]
+assert list(r3.cells) == [3, 0, 3, 3]
+assert list(r3.is_panel) == [True, False, True, True]
+assert not pgm2.pgm.is_panel()
+pgm3 = pgm1.copy()
+pgm3.loc[pgm3.month_id == 403, 'pg_id'] = [62356, 62357, 80318]
+assert list(pgm3.pgm.panel_report().is_panel) == [True, True, True, False]
+assert not pgm1.iloc[:0].pgm.is_panel()
+pgy1 = pgm1.rename(columns={'month_id': 'year_id'}).assign(year_id=lambda x: x.year_id + 1600)
+assert pgy1.pgy.is_panel()
+pgy2 = pgy1[~((pgy1.pg_id == 80317) & (pgy1.year_id == 2001))]
+assert list(pgy2.pgy.panel_report().cells) == [3, 2, 3, 3]
+assert not pgy2.pgy.is_panel()
+assert not pgy1.iloc[:0].pgy.is_panel()
+
+# Gap filling, chunked and not, matches the cross merge it replaces
+
+pgm4 = pd.DataFrame({'pg_id': [62356, 62357, 80317, 62356, 80317, 62357],
+                     'month_id': [400, 400, 401, 403, 405, 405],
+                     'value': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+                     'label': ['a', 'b', 'c', 'd', 'e', 'f']})
+pgm4_extent = pd.DataFrame({'month_id': range(400, 406), 'key': 0}).merge(
+    pd.DataFrame({'key': 0, 'pg_id': pgm4.pg_id.unique()}), on='key')[['pg_id', 'month_id']]
+pgm4_expected = pgm4_extent.merge(pgm4, how='left', on=['pg_id', 'month_id'])
+pd.testing.assert_frame_equal(pgm4.pgm.fill_panel_gaps(), pgm4_expected)
+pd.testing.assert_frame_equal(pd.concat(pgm4.pgm.iter_panel_gaps(chunk_size=4)), pgm4.pgm.fill_panel_gaps())
+pd.testing.assert_frame_equal(pd.concat(pgm4.pgm.iter_panel_gaps(chunk_size=1, fill_value=0)),
+                              pgm4.pgm.fill_panel_gaps(fill_value=0))
+assert pgm4.pgm.fill_panel_gaps(fill_value=0).value.isna().sum() == 0
+assert pgm4.pgm.fill_panel_gaps().shape == (18, 4)
+pgy4 = pgm4.rename(columns={'month_id': 'year_id'}).assign(year_id=lambda x: x.year_id + 1600)
+pd.testing.assert_frame_equal(pd.concat(pgy4.pgy.iter_panel_gaps(chunk_size=2)), pgy4.pgy.fill_panel_gaps())
+
+# Neighbors and spatial lags
+
+cm4 = CMAccessor.new_structure(max_month=402)
+cm4 = cm4[cm4.month_id >= 400].reset_index(drop=True)
+cm4['value'] = np.arange(cm4.shape[0], dtype='float64')
+cm4.loc[::7, 'value'] = np.nan
+pairs = cm4.cm.explode_neighbors()
+assert pairs.shape[0] > 0
+for c_id, month_id in cm4[['c_id', 'month_id']].head(30).itertuples(index=False):
+    assert list(pairs[(pairs.c_id == c_id) & (pairs.month_id == month_id)].neighbor_id) == \
+           [c.id for c in Country(c_id).neighbors(month_id)]
+lag_source = pairs[['c_id', 'month_id', 'neighbor_id']].merge(cm4.rename(columns={'c_id': 'neighbor_id'}),
+                                                              on=['neighbor_id', 'month_id'])
+for how in ('sum', 'mean', 'max'):
+    expected = lag_source.groupby(['c_id', 'month_id']).value.agg(how).rename('expected').reset_index()
+    expected = cm4.merge(expected, on=['c_id', 'month_id'], how='left').expected
+    if how == 'sum':
+        expected = expected.fillna(0)
+    assert np.allclose(cm4.cm.spatial_lag('value', how), expected, equal_nan=True)
+
+try:
+    pd.concat([cm4, cm4]).cm.spatial_lag('value')
+    assert False
+except ValueError:
+    pass
+
+# Bulk ISO/GW resolution matches the scalar resolvers row by row
+
+
+def scalar_c_ids(resolver, codes, months=None):
+    c_ids = []
+    for i, code in enumerate(codes):
+        try:
+            c_ids += [resolver(code) if months is None else resolver(code, months[i])]
+        except ValueError:
+            c_ids += [0]
+    return c_ids
+
+
+isos = ['RUS', 'SUN', 'DEU', 'GFR', 'GDR', 'SRB', 'YUG', ' swe ', 'ZZZ']
+gwcodes = [365, 260, 265, 345, 340, 380, 999]
+months = [100, 140, 200, 500, np.nan]
+for codes, resolver, bulk, col in ((isos, Country.iso2id, Country.isos2ids, 'iso'),
+                                   (gwcodes, Country.gwcode2id, Country.gwcodes2ids, 'gwcode')):
+    codes_months = pd.DataFrame([(code, month) for code in codes for month in months], columns=[col, 'month_id'])
+    c_ids, valid = bulk(codes_months[col])
+    assert list(c_ids) == scalar_c_ids(resolver, list(codes_months[col]))
+    assert list(valid) == [c_id != 0 for c_id in c_ids]
+    c_ids, valid = bulk(codes_months[col], codes_months.month_id)
+    assert list(c_ids) == scalar_c_ids(resolver, list(codes_months[col]), list(codes_months.month_id))
+    assert list(valid) == [c_id != 0 for c_id in c_ids]
+    validator = CAccessor.soft_validate_iso if col == 'iso' else CAccessor.soft_validate_gwcode
+    assert list(validator(codes_months, col, month_col='month_id').valid_id) == list(valid)
+    factory = pd.DataFrame.c.from_iso if col == 'iso' else pd.DataFrame.c.from_gwcode
+    resolved = factory(codes_months[valid], col, month_col='month_id')
+    assert list(resolved.c_id) == list(c_ids[valid])
+    try:
+        factory(codes_months, col, month_col='month_id')
+        assert False
+    except ValueError:
+        pass
+
+# Lifespan expansion matches a per-country range build
+
+
+def range_build(c_ids, start, end, low, high):
+    rows = []
+    for c_id in pd.unique(pd.Series(c_ids)):
+        country = Country(c_id)
+        rows += [(c_id, t) for t in range(max(getattr(country, start), low), min(getattr(country, end), high) + 1)]
+    return rows
+
+
+lifespan_countries = [218, 117, 234, 57, 67]
+one_month = Country(lifespan_countries[0]).month_end
+for low, high in ((1, 999), (400, 420), (one_month, 999), (one_month, one_month)):
+    expected = range_build(lifespan_countries, 'month_start', 'month_end', low, high)
+    extents = CAccessor._expand_lifespans(lifespan_countries + [lifespan_countries[0], 0], 'month_id',
+                                          'month_start', 'month_end', min_time=low, max_time=high)
+    assert list(extents[['c_id', 'month_id']].itertuples(index=False, name=None)) == expected
+    cm5 = pd.DataFrame({'c_id': lifespan_countries, 'month_id': low, 'value': 1.0}).cm.expand_country_months(low, high)
+    assert list(cm5[['c_id', 'month_id']].itertuples(index=False, name=None)) == expected
+    assert cm5.value.notna().sum() == sum(1 for row in expected if row[1] == low)
+
+one_year = Country(lifespan_countries[0]).year_end
+for low, high in ((1945, 2050), (2000, 2005), (one_year, one_year)):
+    expected = range_build(lifespan_countries, 'year_start', 'year_end', low, high)
+    cy5 = pd.DataFrame({'c_id': lifespan_countries, 'year_id': low}).cy.expand_country_year(low, high)
+    assert list(cy5[['c_id', 'year_id']].itertuples(index=False, name=None)) == expected
+
+# Bounding boxes match a Priogrid.from_row_col build
+
+
+def row_col_bbox(pg_ids, only_views_cells=False):
+    rows = [Priogrid(i).row for i in pg_ids]
+    cols = [Priogrid(i).col for i in pg_ids]
+    square = set(Priogrid.from_row_col(row=row, col=col).id
+                 for row in range(min(rows), max(rows) + 1) for col in range(min(cols), max(cols) + 1))
+    if only_views_cells:
+        square = square.intersection(fetch_ids('priogrid')[0])
+    return square
+
+
+land_cells = sorted(fetch_ids('priogrid')[0])
+for box_cells in ([62356, 62357, 63077],        # small box
+                  [720, 1441],                  # column 0 on the western edge
+                  [43201, 43919, 44640],        # from col 1 to the antimeridian
+                  [258481, 259199],             # last full row
+                  land_cells[1000:1003]):
+    pg5 = pd.DataFrame({'pg_id': box_cells, 'value': 1.0})
+    for only_views_cells in (False, True):
+        expected = row_col_bbox(box_cells, only_views_cells)
+        assert pg5.pg.get_bbox(only_views_cells) == expected
+        assert list(pg5.pg._bbox(only_views_cells)) == sorted(expected)
+        assert pg5.pg._bbox(only_views_cells) is pg5.pg._bbox(only_views_cells)
+        assert not pg5.pg._bbox(only_views_cells).flags.writeable
+        if only_views_cells:
+            assert set(PgAccessor._land_mask().nonzero()[0]) == set(land_cells)
+            assert list(PgAccessor._bbox_ids(1, 2, 0, 719, True)) == [i for i in land_cells if i <= 2 * 720 - 1]
+        box5 = pd.DataFrame({'pg_id': sorted(expected)})
+        assert box5.pg.is_bbox(only_views_cells) or len(expected) == 0
+        assert pg5.pg.is_bbox(only_views_cells) == (set(box_cells) == expected)
+    filled = pg5.pg.fill_bbox(fill_value=0.0)
+    assert sorted(filled.pg_id) == sorted(row_col_bbox(box_cells))
+    assert filled.value.sum() == len(box_cells)
+    assert filled.value.notna().all()
+    assert set(filled[filled.value == 1.0].pg_id) == set(box_cells)
+
+# lookup_ids matches a merge over the id structure
+
+from ingester3.scratch import lookup_ids
+
+pgm_ids = fetch_ids_df('priogrid_month')
+pgm_sample = pgm_ids.sample(5000, random_state=0)
+pgm_keys = pd.DataFrame({'pg_id': np.r_[pgm_sample.priogrid_gid.to_numpy(), [0, 1, 259200, 62356, 62356, np.nan, 62356]],
+                         'month_id': np.r_[pgm_sample.month_id.to_numpy(), [1, 1, 1, 0, 100000, 1, np.nan]]})
+expected = pgm_keys.merge(pgm_ids, left_on=['pg_id', 'month_id'], right_on=['priogrid_gid', 'month_id'], how='left').id
+ids, valid = lookup_ids('priogrid_month', pgm_keys.pg_id, pgm_keys.month_id)
+assert list(valid) == list(expected.notna())
+assert list(ids[valid]) == list(expected[expected.notna()].astype('int64'))
+assert (ids[~valid] == 0).all()
+assert not valid[-7:][[0, 3, 4, 5, 6]].any()
+ids, valid = lookup_ids('priogrid_month', pgm_keys.pg_id.astype('Int64'), pgm_keys.month_id.astype('Int64'))
+assert list(valid) == list(expected.notna())
+
+# The id structures are owned, writable frames
+
+for structure in (CAccessor.new_structure(), PgAccessor.new_structure(), CYAccessor.new_structure(),
+                  CMAccessor.new_structure(), PGMAccessor.new_structure(), PGYAccessor.new_structure()):
+    first = structure.columns[0]
+    structure.iloc[0, 0] = -1
+    structure.loc[structure.index[1], first] = -2
+    structure[first] += 0
+    assert list(structure[first].iloc[:2]) == [-1, -2]
+assert fetch_ids_df('country').id.min() > 0
+
+# The id structures are read over disjoint primary key ranges, and put back together in key order
+
+import os
+import tempfile
+from unittest import mock
+import sqlalchemy as sa
+import ingester3.scratch as scratch
+
+range_engine = sa.create_engine('sqlite:///' + os.path.join(tempfile.mkdtemp(), 'range_ids.db'))
+range_table = sa.Table('range_ids', sa.MetaData(), sa.Column('id', sa.Integer, primary_key=True),
+                       sa.Column('month_id', sa.Integer))
+range_table.create(range_engine)
+range_rows = pd.DataFrame({'id': np.sort(np.random.default_rng(0).choice(np.arange(10, 400000), 130000, replace=False))})
+range_rows['month_id'] = range_rows.id % 852
+with range_engine.begin() as conn:
+    conn.execute(range_table.insert(), range_rows.to_dict('records'))
+
+range_queries = []
+
+
+def range_read_sql(query, con, chunksize):
+    range_queries.append(str(query.compile(compile_kwargs={'literal_binds': True})))
+    result = con.execute(query)
+    while True:
+        rows = result.fetchmany(chunksize)
+        if len(rows) == 0:
+            break
+        yield pd.DataFrame(rows, columns=list(result.keys()))
+
+
+range_progress = []
+with mock.patch.object(scratch, 'views_engine', range_engine), \
+        mock.patch.object(scratch, 'fetch_keys', lambda loa_table: ([range_table.c.id], [range_table.c.month_id])), \
+        mock.patch.object(scratch, 'fetch_counts', lambda loa_table: range_rows.shape[0]), \
+        mock.patch.object(pd, 'read_sql', range_read_sql):
+    for workers in (1, 4):
+        range_queries.clear()
+        range_progress.clear()
+        ids = scratch.__query_ids_df('range_ids', workers=workers, progress=lambda *read: range_progress.append(read))
+        pd.testing.assert_frame_equal(ids, range_rows)
+        assert len(range_queries) == workers
+        assert range_progress[0] == (0, range_rows.shape[0])
+        assert range_progress[-1] == (range_rows.shape[0], range_rows.shape[0])
+        assert [read for read, _ in range_progress] == sorted(read for read, _ in range_progress)
+        # one call per chunk of at most 50000 rows, at least one chunk per range
+        assert len(range_progress) - 1 >= max(workers, range_rows.shape[0] // 50000 + 1)
+    assert sum('>=' in query for query in range_queries) == 3
+    assert sum('<' in query.replace('<=', '') for query in range_queries) == 3
+
+# COPY reads give the same frame as pd.read_sql on the same rows
+
+import re
+import sqlite3
+
+copy_db = sqlite3.connect(':memory:')
+copy_db.execute('CREATE TABLE copy_rows (id INTEGER, gid INTEGER, value REAL, name TEXT, day TEXT)')
+copy_names = ['NA', 'N/A', 'null', 'None', 'nan', '', None, '007', 'a,b', 'say "hi"', 'two\nlines', 'x']
+copy_db.executemany('INSERT INTO copy_rows VALUES (?, ?, ?, ?, ?)',
+                    [(i, None if i % 4 == 0 else i * 10, None if i % 3 == 0 else i / 2, name,
+                      None if i % 5 == 0 else f'2020-01-{i + 1:02d}') for i, name in enumerate(copy_names)])
+
+
+class CopyCursor:
+    """A cursor exporting a query the way COPY ... TO STDOUT WITH (FORMAT csv, HEADER true, NULL ...) does."""
+    def copy_expert(self, sql, file):
+        query, null = re.match(r"COPY \((.*)\) TO STDOUT WITH \(FORMAT csv, HEADER true, NULL '(.*)'\)$",
+                               sql, re.S).groups()
+        rows = copy_db.execute(query)
+
+        def cell(value):
+            if value is None:
+                return null
+            value = str(value)
+            if value in ('', null) or any(char in value for char in ',"\n'):
+                return '"' + value.replace('"', '""') + '"'
+            return value
+
+        lines = [','.join(column[0] for column in rows.description)]
+        lines += [','.join(cell(value) for value in row) for row in rows.fetchall()]
+        file.write(('\n'.join(lines) + '\n').encode())
+
+    def close(self):
+        pass
+
+
+class CopyConnection:
+    def cursor(self):
+        return CopyCursor()
+
+    def close(self):
+        pass
+
+
+copy_query = 'SELECT day, value, id, name, gid FROM copy_rows ORDER BY id'
+with mock.patch.object(scratch.views_engine, 'raw_connection', CopyConnection):
+    copied = scratch.read_sql_copy(copy_query, parse_dates=['day'], dtype={'name': str})
+expected = pd.read_sql(copy_query, copy_db, parse_dates=['day'])
+assert list(copied.columns) == ['day', 'value', 'id', 'name', 'gid']
+assert list(copied.dtypes) == list(expected.dtypes)
+assert copied.name.tolist()[:6] == copy_names[:6] and copied.name.isna().tolist() == expected.name.isna().tolist()
+pd.testing.assert_frame_equal(copied, expected)
+
+# Cached country results are dropped by a cache clear, and are keyed by the column contents
+
+from ingester3.extensions import _results
+
+c5 = pd.DataFrame({'c_id': [218, 117, 234, 218]})
+c5_key = ('c_attr', 'name') + _results.fingerprint(c5.c_id)
+names = c5.c.name.tolist()
+assert _results.get(c5_key) is not None
+cache_manager(clear=True)
+assert _results.get(c5_key) is None
+assert c5.c.name.tolist() == names
+assert _results.get(c5_key) is not None
+
+c6 = c5.copy()
+c6.loc[0, 'c_id'] = 117
+assert _results.fingerprint(c6.c_id) != _results.fingerprint(c5.c_id)
+assert _results.fingerprint(c5.copy().c_id) == _results.fingerprint(c5.c_id)
+assert c6.c.name.tolist() == [names[1]] + names[1:]
+assert c5.c.name.tolist() == names
+
+# The memory tier evicts by count and by size, and is emptied by clear_memory_tier
+
+tier_calls = []
+
+
+@scratch.memory_tier(maxsize=3, max_bytes=100, sizeof=len)
+def tier_fetch(name, size):
+    tier_calls.append(name)
+    return 'x' * size
+
+
+for name, size in (('a', 10), ('b', 10), ('c', 10), ('a', 10), ('d', 10)):
+    tier_fetch(name, size)
+assert tier_calls == ['a', 'b', 'c', 'd']
+tier_fetch('b', 10)
+tier_fetch('a', 10)
+assert tier_calls == ['a', 'b', 'c', 'd', 'b']
+tier_fetch('big', 90)
+assert tier_fetch.cache_info() == {'entries': 2, 'bytes': 100}
+tier_fetch('a', 10)
+tier_fetch('huge', 101)
+tier_fetch('huge', 101)
+assert tier_calls[-3:] == ['big', 'huge', 'huge']
+assert tier_fetch.cache_info() == {'entries': 2, 'bytes': 100}
+scratch.clear_memory_tier()
+assert tier_fetch.cache_info() == {'entries': 0, 'bytes': 0}
+tier_fetch('big', 90)
+assert tier_calls[-1] == 'big'
+
+assert scratch.fetch_ids('country') is scratch.fetch_ids('country')
+assert scratch.fetch_ids.cache_info()['bytes'] <= 256 * 2 ** 20
+scratch.clear_memory_tier()
+assert scratch.fetch_ids.cache_info()['entries'] == 0
+
+
+# The schema snapshot matches live reflection
+
+import warnings
+
+snapshot = scratch.fetch_schema()
+for snapshot_table in ['country', 'country_month', 'country_year', 'priogrid_month', 'priogrid_year'] + \
+                      [child['table'] for child in scratch.fetch_children('country_month')]:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=sa.exc.SAWarning)
+        live = sa.Table(snapshot_table, sa.MetaData(), schema='prod', autoload_with=scratch.views_engine)
+    snapped = snapshot.table(snapshot_table)
+    assert [column.name for column in snapped.c] == [column.name for column in live.c]
+    assert [type(column.type) for column in snapped.c] == [type(column.type) for column in live.c]
+    assert [column.name for column in snapped.primary_key] == [column.name for column in live.primary_key]
+    assert sorted((fk.parent.name, fk.target_fullname) for fk in snapped.foreign_keys) == \
+           sorted((fk.parent.name, fk.target_fullname) for fk in live.foreign_keys)
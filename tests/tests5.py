@@ -5,3 +5,26 @@ assert ViewsMonth(509) > ViewsMonth(501)
 assert ViewsMonth(529) < ViewsMonth(591)
 assert ViewsMonth(591) <= ViewsMonth(591)
 assert ViewsMonth(599) >= ViewsMonth(591)
+
+# The vectorized conversions match the ViewsMonth objects
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+ids = np.arange(1, 900)
+assert list(ViewsMonth.id2month_array(ids)) == [ViewsMonth(i).month for i in ids]
+assert list(ViewsMonth.id2year_array(ids)) == [ViewsMonth(i).year for i in ids]
+
+years = [1979, 1980, 1999, 2023, np.nan, 2000, 2000]
+months = [1, 1, 12, 7, 3, 0, 13]
+ids, valid = ViewsMonth.year_month2id_array(years, months)
+assert list(valid) == [False, True, True, True, False, False, False]
+assert list(ids) == [0, ViewsMonth.from_year_month(1980, 1).id, ViewsMonth.from_year_month(1999, 12).id,
+                     ViewsMonth.from_year_month(2023, 7).id, 0, 0, 0]
+
+dates = pd.to_datetime(['1979-12-31', '1980-01-01', '2021-08-31 23:59:00', None], format='ISO8601')
+ids, valid = ViewsMonth.datetime2id_array(dates)
+assert list(valid) == [False, True, True, False]
+assert list(ids) == [0, ViewsMonth.from_date(datetime(1980, 1, 1)).id,
+                     ViewsMonth.from_date(datetime(2021, 8, 31)).id, 0]
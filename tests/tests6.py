@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from ingester3.Priogrid import Priogrid
+from ingester3.IdArray import PriogridArray
+
+# Construction and missing values
+
+p1 = PriogridArray._from_sequence([1, 62356, None, Priogrid(720), 259200.0, np.nan])
+assert len(p1) == 6
+assert p1.dtype.name == 'priogrid'
+assert p1.nbytes == 24
+assert list(p1.isna()) == [False, False, True, False, False, True]
+assert p1[1] == 62356
+assert p1[2] is pd.NA
+assert p1[3] == 720
+
+try:
+    PriogridArray([0, 5])
+    assert False
+except ValueError:
+    pass
+
+try:
+    PriogridArray._from_sequence([1.5])
+    assert False
+except TypeError:
+    pass
+
+assert list(PriogridArray.valid([1, '62356', 0, 259201, 2.5, None, 'e'])) == \
+       [True, True, False, False, False, False, False]
+
+# astype
+
+s1 = pd.Series([62356, 62357, 259200, 1, 720, 721]).astype('priogrid')
+assert s1.dtype == 'priogrid'
+assert s1.astype('int64').tolist() == [62356, 62357, 259200, 1, 720, 721]
+assert pd.Series(p1).astype('float64').isna().sum() == 2
+assert pd.Series(p1).astype(object)[2] is pd.NA
+
+# take and concat
+
+assert p1.take([3, 0])[0] == 720
+assert p1.take([3, 0])[1] == 1
+assert list(p1.take([1, -1], allow_fill=True).isna()) == [False, True]
+s2 = pd.concat([s1, s1])
+assert s2.dtype == 'priogrid'
+assert s2.shape == (12,)
+
+# sort, groupby and merge
+
+df1 = pd.DataFrame({'cell': s1, 'v': range(6)})
+assert df1.sort_values('cell').cell.tolist() == [1, 720, 721, 62356, 62357, 259200]
+assert df1.groupby('cell').v.sum().to_dict() == {1: 3, 720: 4, 721: 5, 62356: 0, 62357: 1, 259200: 2}
+df2 = pd.DataFrame({'cell': pd.Series([62356, 5]).astype('priogrid'), 'w': [1.0, 2.0]})
+df3 = df1.merge(df2, on='cell', how='inner')
+assert df3.shape == (1, 3)
+assert df3.cell.dtype == 'priogrid'
+assert df3.w[0] == 1.0
+assert s1.min() == 1 and s1.max() == 259200
+
+# Comparisons
+
+assert (s1 == 62356).tolist() == [True, False, False, False, False, False]
+assert (s1 > 721).tolist() == [True, True, True, False, False, False]
+assert (pd.Series(p1) == Priogrid(720)).tolist() == [False, False, False, True, False, False]
+assert (pd.Series(p1) >= 1).tolist() == [True, True, False, True, True, False]
+
+# Geometry and contiguity match the Priogrid objects
+
+p2 = PriogridArray(np.random.default_rng(0).integers(1, 259201, 2000))
+assert p2.row.tolist() == [Priogrid(i).row for i in p2]
+assert p2.col.tolist() == [Priogrid(i).col for i in p2]
+assert np.allclose(p2.lat, [Priogrid(i).lat for i in p2])
+assert np.allclose(p2.lon, [Priogrid(i).lon for i in p2])
+assert np.isnan(p1.lat[2])
+
+for contiguity in ('rook', 'queen'):
+    neighbors = p2.neighbors(contiguity)
+    assert all(neighbors.dtypes == 'priogrid')
+    for i in p2[:200]:
+        try:
+            matrix = getattr(Priogrid(i), contiguity + '_contiguity')()
+        except ValueError:
+            # The scalar contiguity crashes on some cells of column 0, see PriogridArray.neighbors.
+            continue
+        expected = [pd.NA if cell is None or cell.id < 1 else cell.id for line in matrix for cell in line]
+        got = list(getattr(Priogrid(i), contiguity + '_contiguity')(as_array=True))
+        assert [None if j is pd.NA else j for j in got] == [None if j is pd.NA else j for j in expected]
+
+assert list(PriogridArray([259200]).neighbors('rook').iloc[0].isna()) == [True, True, True, False]
+
+# ViewsMonthArray
+
+from ingester3.ViewsMonth import ViewsMonth
+from ingester3.IdArray import ViewsMonthArray
+
+m1 = ViewsMonthArray._from_sequence([1, None, ViewsMonth(500)])
+assert m1.dtype.name == 'views_month'
+assert list(m1.isna()) == [False, True, False]
+assert m1[2] == 500
+
+m2 = ViewsMonthArray(np.arange(1, 700))
+assert m2.year.tolist() == [ViewsMonth(i).year for i in m2]
+assert m2.month.tolist() == [ViewsMonth(i).month for i in m2]
+assert list(np.datetime_as_string(m2.start_date)) == [ViewsMonth(i).start_date for i in m2]
+assert list(np.datetime_as_string(m2.end_date)) == [ViewsMonth(i).end_date for i in m2]
+assert m1.year[1] is pd.NA
+assert np.isnat(m1.start_date[1]) and np.isnat(m1.end_date[1])
+
+# datetime64[M] both ways
+
+assert m2.to_datetime64().dtype == 'datetime64[M]'
+assert (ViewsMonthArray.from_date(m2.to_datetime64()) == m2).all()
+assert (ViewsMonthArray.from_date(pd.to_datetime(m2.start_date)) == m2).all()
+m3 = ViewsMonthArray.from_date(np.array(['2020-03-15', 'NaT'], dtype='datetime64[s]'))
+assert m3[0] == ViewsMonth.from_year_month(2020, 3).id
+assert m3[1] is pd.NA
+m4 = ViewsMonthArray.from_year_month([2020, np.nan, 1980], [3, 1, 1])
+assert m4[0] == 483 and m4[1] is pd.NA and m4[2] == 1
+
+try:
+    ViewsMonthArray.from_year_month([1979], [1])
+    assert False
+except ValueError:
+    pass
+
+try:
+    ViewsMonthArray.from_date(np.array(['1975-01'], dtype='datetime64[M]'))
+    assert False
+except ValueError:
+    pass
+
+s3 = pd.Series(m1)
+assert s3.astype('datetime64[ns]').dt.month.tolist()[::2] == [1, 8]
+assert s3.astype('datetime64[ns]').isna().tolist() == [False, True, False]
+
+# Comparisons, take/concat and groupby
+
+assert (s3 < 400).tolist() == [True, False, False]
+assert (s3 >= ViewsMonth(500)).tolist() == [False, False, True]
+assert (s3 != 1).tolist() == [False, True, True]
+assert pd.concat([s3, s3]).dtype == 'views_month'
+assert list(m1.take([2, -1], allow_fill=True).isna()) == [False, True]
+df4 = pd.DataFrame({'month': pd.Series([3, 1, 3]).astype('views_month'), 'v': [1, 2, 3]})
+assert df4.groupby('month').v.sum().to_dict() == {1: 2, 3: 4}
+assert df4.merge(df4, on='month').shape == (5, 3)
+
+# Ids past the int32 range are rejected rather than wrapped around
+
+for wide in (np.array([2 ** 32 + 62356], dtype='int64'), np.array([2 ** 31], dtype='uint32'), [2 ** 31 + 1]):
+    for array_type in (PriogridArray, ViewsMonthArray):
+        try:
+            array_type(wide)
+            assert False
+        except ValueError:
+            pass
+int32_ids = np.array([1, 720], dtype='int32')
+assert PriogridArray(int32_ids)._data is int32_ids
+assert PriogridArray(int32_ids, copy=True)._data is not int32_ids
+
+# Strings convert exactly when valid says so
+
+id_strings = ['1', '62356', ' 720 ', '259200.0', '0', '259201', '2.5', 'e', '', '-1', '4294967297']
+for string, valid in zip(id_strings, PriogridArray.valid(id_strings)):
+    try:
+        pd.Series([string], dtype='str').astype('priogrid')
+        assert valid
+    except (TypeError, ValueError):
+        assert not valid
+s4 = pd.Series(['1', None, '62356'], dtype='str').astype('priogrid')
+assert s4.dtype == 'priogrid' and s4[0] == 1 and s4[1] is pd.NA and s4[2] == 62356
+assert pd.Series(['5', '497'], dtype=object).astype('str').astype('views_month').tolist() == [5, 497]